@@ -0,0 +1,217 @@
+# vim: ts=2 sw=2 expandtab
+
+"""EBCDIC code pages shared by the Hercules utilities.
+
+Each code page holds precompiled 256 byte translation tables in both
+directions, ASCII (Latin-1) to EBCDIC and back, suitable for
+bytes.translate(), so nothing is rebuilt at run time.
+
+The code pages offered are:
+
+    LEGACY  The table vmsubmit.py and tcpdumpe.py have always used:
+            CP037 with the CP1047 brackets, mapping only printable
+            ASCII (and the logical not sign).  Other characters become
+            0xFF in EBCDIC, and unmapped EBCDIC becomes SUB (0x1A).
+    CP037   US/Canada EBCDIC, as used by VM/370 and most older systems.
+    CP500   International EBCDIC.
+    CP1047  Latin-1 open systems EBCDIC, as used by z/OS UNIX and z/VM
+            OpenExtensions.
+
+CP037, CP500 and CP1047 map all 256 Latin-1 characters, so text in them
+round-trips exactly.
+"""
+
+__author__ = 'ahd@kew.com (Drew Derbyshire)'
+__version__ = '1.0.0'
+
+LEGACY = 'LEGACY'
+
+# pylint: disable=C0301
+# Tables are indexed by the source character; each line is 16 entries.
+
+_LEGACY_ENCODE = bytes.fromhex(
+    'ffffffff ffffffff ffffffff ffffffff'
+    'ffffffff ffffffff ffffffff ffffffff'
+    '405a7f7b 5b6c507d 4d5d5c4e 6b604b61'
+    'f0f1f2f3 f4f5f6f7 f8f97a5e 4c7e6e6f'
+    '7cc1c2c3 c4c5c6c7 c8c9d1d2 d3d4d5d6'
+    'd7d8d9e2 e3e4e5e6 e7e8e9ad e0bdff6d'
+    '79818283 84858687 88899192 93949596'
+    '979899a2 a3a4a5a6 a7a8a9c0 4fd0a1ff'
+    'ffffffff ffffffff ffffffff ffffffff'
+    'ffffffff ffffffff ffffffff ffffffff'
+    'ffffffff ffffffff ffff5fff 5fffffff'
+    'ffffffff ffffffff ffffffff ffffffff'
+    'ffffffff ffffffff ffffffff ffffffff'
+    'ffffffff ffffffff ffffffff ffffffff'
+    'ffffffff ffffffff ffffffff ffffffff'
+    'ffffffff ffffffff ffffffff ffffffff')
+
+_LEGACY_DECODE = bytes.fromhex(
+    '1a1a1a1a 1a1a1a1a 1a1a1a1a 1a1a1a1a'
+    '1a1a1a1a 1a1a1a1a 1a1a1a1a 1a1a1a1a'
+    '1a1a1a1a 1a1a1a1a 1a1a1a1a 1a1a1a1a'
+    '1a1a1a1a 1a1a1a1a 1a1a1a1a 1a1a1a1a'
+    '201a1a1a 1a1a1a1a 1a1a1a2e 3c282b7c'
+    '261a1a1a 1a1a1a1a 1a1a2124 2a293bac'
+    '2d2f1a1a 1a1a1a1a 1a1a1a2c 255f3e3f'
+    '1a1a1a1a 1a1a1a1a 1a603a23 40273d22'
+    '1a616263 64656667 68691a1a 1a1a1a1a'
+    '1a6a6b6c 6d6e6f70 71721a1a 1a1a1a1a'
+    '1a7e7374 75767778 797a1a1a 1a5b1a1a'
+    '1a1a1a1a 1a1a1a1a 1a1a1a1a 1a5d1a1a'
+    '7b414243 44454647 48491a1a 1a1a1a1a'
+    '7d4a4b4c 4d4e4f50 51521a1a 1a1a1a1a'
+    '5c1a5354 55565758 595a1a1a 1a1a1a1a'
+    '30313233 34353637 38391a1a 1a1a1a1a')
+
+_CP037_ENCODE = bytes.fromhex(
+    '00010203 372d2e2f 1605250b 0c0d0e0f'
+    '10111213 3c3d3226 18193f27 1c1d1e1f'
+    '405a7f7b 5b6c507d 4d5d5c4e 6b604b61'
+    'f0f1f2f3 f4f5f6f7 f8f97a5e 4c7e6e6f'
+    '7cc1c2c3 c4c5c6c7 c8c9d1d2 d3d4d5d6'
+    'd7d8d9e2 e3e4e5e6 e7e8e9ba e0bbb06d'
+    '79818283 84858687 88899192 93949596'
+    '979899a2 a3a4a5a6 a7a8a9c0 4fd0a107'
+    '20212223 24150617 28292a2b 2c090a1b'
+    '30311a33 34353608 38393a3b 04143eff'
+    '41aa4ab1 9fb26ab5 bdb49a8a 5fcaafbc'
+    '908feafa bea0b6b3 9dda9b8b b7b8b9ab'
+    '64656266 63679e68 74717273 78757677'
+    'ac69edee ebefecbf 80fdfefb fcadae59'
+    '44454246 43479c48 54515253 58555657'
+    '8c49cdce cbcfcce1 70dddedb dc8d8edf')
+
+_CP037_DECODE = bytes.fromhex(
+    '00010203 9c09867f 978d8e0b 0c0d0e0f'
+    '10111213 9d850887 1819928f 1c1d1e1f'
+    '80818283 840a171b 88898a8b 8c050607'
+    '90911693 94959604 98999a9b 14159e1a'
+    '20a0e2e4 e0e1e3e5 e7f1a22e 3c282b7c'
+    '26e9eaeb e8edeeef ecdf2124 2a293bac'
+    '2d2fc2c4 c0c1c3c5 c7d1a62c 255f3e3f'
+    'f8c9cacb c8cdcecf cc603a23 40273d22'
+    'd8616263 64656667 6869abbb f0fdfeb1'
+    'b06a6b6c 6d6e6f70 7172aaba e6b8c6a4'
+    'b57e7374 75767778 797aa1bf d0dddeae'
+    '5ea3a5b7 a9a7b6bc bdbe5b5d afa8b4d7'
+    '7b414243 44454647 4849adf4 f6f2f3f5'
+    '7d4a4b4c 4d4e4f50 5152b9fb fcf9faff'
+    '5cf75354 55565758 595ab2d4 d6d2d3d5'
+    '30313233 34353637 3839b3db dcd9da9f')
+
+_CP500_ENCODE = bytes.fromhex(
+    '00010203 372d2e2f 1605250b 0c0d0e0f'
+    '10111213 3c3d3226 18193f27 1c1d1e1f'
+    '404f7f7b 5b6c507d 4d5d5c4e 6b604b61'
+    'f0f1f2f3 f4f5f6f7 f8f97a5e 4c7e6e6f'
+    '7cc1c2c3 c4c5c6c7 c8c9d1d2 d3d4d5d6'
+    'd7d8d9e2 e3e4e5e6 e7e8e94a e05a5f6d'
+    '79818283 84858687 88899192 93949596'
+    '979899a2 a3a4a5a6 a7a8a9c0 bbd0a107'
+    '20212223 24150617 28292a2b 2c090a1b'
+    '30311a33 34353608 38393a3b 04143eff'
+    '41aab0b1 9fb26ab5 bdb49a8a bacaafbc'
+    '908feafa bea0b6b3 9dda9b8b b7b8b9ab'
+    '64656266 63679e68 74717273 78757677'
+    'ac69edee ebefecbf 80fdfefb fcadae59'
+    '44454246 43479c48 54515253 58555657'
+    '8c49cdce cbcfcce1 70dddedb dc8d8edf')
+
+_CP500_DECODE = bytes.fromhex(
+    '00010203 9c09867f 978d8e0b 0c0d0e0f'
+    '10111213 9d850887 1819928f 1c1d1e1f'
+    '80818283 840a171b 88898a8b 8c050607'
+    '90911693 94959604 98999a9b 14159e1a'
+    '20a0e2e4 e0e1e3e5 e7f15b2e 3c282b21'
+    '26e9eaeb e8edeeef ecdf5d24 2a293b5e'
+    '2d2fc2c4 c0c1c3c5 c7d1a62c 255f3e3f'
+    'f8c9cacb c8cdcecf cc603a23 40273d22'
+    'd8616263 64656667 6869abbb f0fdfeb1'
+    'b06a6b6c 6d6e6f70 7172aaba e6b8c6a4'
+    'b57e7374 75767778 797aa1bf d0dddeae'
+    'a2a3a5b7 a9a7b6bc bdbeac7c afa8b4d7'
+    '7b414243 44454647 4849adf4 f6f2f3f5'
+    '7d4a4b4c 4d4e4f50 5152b9fb fcf9faff'
+    '5cf75354 55565758 595ab2d4 d6d2d3d5'
+    '30313233 34353637 3839b3db dcd9da9f')
+
+_CP1047_ENCODE = bytes.fromhex(
+    '00010203 372d2e2f 1605250b 0c0d0e0f'
+    '10111213 3c3d3226 18193f27 1c1d1e1f'
+    '405a7f7b 5b6c507d 4d5d5c4e 6b604b61'
+    'f0f1f2f3 f4f5f6f7 f8f97a5e 4c7e6e6f'
+    '7cc1c2c3 c4c5c6c7 c8c9d1d2 d3d4d5d6'
+    'd7d8d9e2 e3e4e5e6 e7e8e9ad e0bd5f6d'
+    '79818283 84858687 88899192 93949596'
+    '979899a2 a3a4a5a6 a7a8a9c0 4fd0a107'
+    '20212223 24150617 28292a2b 2c090a1b'
+    '30311a33 34353608 38393a3b 04143eff'
+    '41aa4ab1 9fb26ab5 bbb49a8a b0caafbc'
+    '908feafa bea0b6b3 9dda9b8b b7b8b9ab'
+    '64656266 63679e68 74717273 78757677'
+    'ac69edee ebefecbf 80fdfefb fcbaae59'
+    '44454246 43479c48 54515253 58555657'
+    '8c49cdce cbcfcce1 70dddedb dc8d8edf')
+
+_CP1047_DECODE = bytes.fromhex(
+    '00010203 9c09867f 978d8e0b 0c0d0e0f'
+    '10111213 9d850887 1819928f 1c1d1e1f'
+    '80818283 840a171b 88898a8b 8c050607'
+    '90911693 94959604 98999a9b 14159e1a'
+    '20a0e2e4 e0e1e3e5 e7f1a22e 3c282b7c'
+    '26e9eaeb e8edeeef ecdf2124 2a293b5e'
+    '2d2fc2c4 c0c1c3c5 c7d1a62c 255f3e3f'
+    'f8c9cacb c8cdcecf cc603a23 40273d22'
+    'd8616263 64656667 6869abbb f0fdfeb1'
+    'b06a6b6c 6d6e6f70 7172aaba e6b8c6a4'
+    'b57e7374 75767778 797aa1bf d05bdeae'
+    'aca3a5b7 a9a7b6bc bdbedda8 af5db4d7'
+    '7b414243 44454647 4849adf4 f6f2f3f5'
+    '7d4a4b4c 4d4e4f50 5152b9fb fcf9faff'
+    '5cf75354 55565758 595ab2d4 d6d2d3d5'
+    '30313233 34353637 3839b3db dcd9da9f')
+
+
+class CodePage:
+  """An EBCDIC code page and its translation tables in both directions."""
+
+  def __init__(self, name, encode_table, decode_table):
+    self.name = name
+    self.encode_table = encode_table
+    self.decode_table = decode_table
+
+  def __str__(self):
+    return self.name
+
+  def Translate(self, data):
+    """Translate Latin-1 bytes to EBCDIC bytes."""
+    return data.translate(self.encode_table)
+
+  def Encode(self, text):
+    """Convert a string to EBCDIC bytes.
+
+    Characters beyond Latin-1 are first replaced with a question mark.
+    """
+    return text.encode('latin-1', errors='replace').translate(
+        self.encode_table)
+
+  def Decode(self, data):
+    """Convert EBCDIC bytes to a string."""
+    return data.translate(self.decode_table).decode('latin-1')
+
+
+CODE_PAGES = {
+    code_page.name: code_page for code_page in (
+        CodePage(LEGACY, _LEGACY_ENCODE, _LEGACY_DECODE),
+        CodePage('CP037', _CP037_ENCODE, _CP037_DECODE),
+        CodePage('CP500', _CP500_ENCODE, _CP500_DECODE),
+        CodePage('CP1047', _CP1047_ENCODE, _CP1047_DECODE),
+    )
+}
+
+
+def Lookup(name):
+  """Return the named code page, ignoring case; raise KeyError if unknown."""
+  return CODE_PAGES[name.upper()]
@@ -20,21 +20,49 @@ You may also want to tune JES2 parms in SYS1.JES2PARM(JES2PARM) to set
 the number of separator page lines to 1:
 
     &PRIDCT=1
+
+To serve many printers (of one or more Hercules instances) from a single
+process, define each printer as a socket device or a FIFO instead:
+
+    000E    1403    127.0.0.1:1403 sockdev
+    000F    1403    /var/spool/hercules/prt00f.fifo
+
+and run spool.py once as a daemon, naming each printer and the
+directory (relative to the spool directory) to write its jobs into:
+
+    spool.py --printer 127.0.0.1:1403=prt00e \\
+             --printer /var/spool/hercules/prt00f.fifo=prt00f print
 """
 
 __author__ = "ahd@kew.com (Drew Derbyshire)"
-__version__ = "1.1.10"
+__version__ = "1.9.0"
 __copyright__ = ('Version ' + __version__ + '. '
                  'Copyright 2022-2023 by Kendra Electronic Wonderworks. '
                  'All commercial rights reserved.\n'
                 )
 
+import argparse
+import collections
+import copy
 from datetime import datetime
+import errno
 import os
+import queue
 import re
 import select
+import selectors
 import signal
+import socket
+import sqlite3
 import sys
+import threading
+import time
+import zlib
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
 
 # pylint: disable=C0301
 #       ....+....1....+....2....+....3....+....4....+....5....+....6....+....7....+....8....+....9....+....*....+....1....+....2....+....3..
@@ -55,7 +83,7 @@ _JES2_PATTERN = (
     r'  '
     r'(?P<jobname>[A-Z0-9@  #$ ]{8,8})'     # job name
     r'  '
-    r'(.{20,20})'                           # programmer name
+    r'(?P<pgmr>.{20,20})'                   # programmer name
     r'  ROOM (?P<room>[\w ]{4,4})'          # room number
     r'  [ \d]\d(?:\.\d\d){2,2} (?:A|P)M'    # time: hh:mm:ss AM/PM
     r' \d\d [A-Z]{3,3} \d\d'                # date: dd mmm yy
@@ -179,6 +207,109 @@ DUMMY = (
 _ZOS_NOBANNER_REGEX = re.compile(_ZOS_NOBANNER_PATTERN)
 
 
+class BannerFormat:
+  """A style of separator page banner (or job start) to split jobs on.
+
+  Each format has a fast precheck of the fixed text which must begin any
+  (stripped) line it matches, so ordinary listing lines are rejected
+  without running its regular expression, and counts of the lines it was
+  tested against and matched.
+  """
+
+  def __init__(self, name, regex, prefixes, no_banner=False):
+    self.name = name
+    self.regex = regex
+    self.prefixes = prefixes
+    # No banner formats recognize the first line of a job, not a banner
+    # page, and are only tried at the top of a page.
+    self.no_banner = no_banner
+    self.tested = 0
+    self.matched = 0
+
+  def Copy(self):
+    """Return a copy of this format with its counts reset."""
+    banner = copy.copy(self)
+    banner.tested = 0
+    banner.matched = 0
+    return banner
+
+  def Precheck(self, text):
+    """Report if text could possibly be matched by this format."""
+    return text.startswith(self.prefixes)
+
+  def Parse(self, text):
+    """Return the fields of text if it matches this format, else None."""
+    self.tested += 1
+    if not self.Precheck(text):
+      return None
+    matches = self.regex.match(text)
+    if not matches:
+      return None
+    self.matched += 1
+    return matches.groupdict()
+
+  def HitRate(self):
+    """Report the fraction of tested lines matched by this format."""
+    return self.matched / self.tested if self.tested else 0.0
+
+
+# Known banner formats, in the order they are initially tried.  Use
+# RegisterBannerFormat to add more.
+_BANNER_FORMATS = [
+    BannerFormat('JES2', _JES2_REGEX, ('****',)),
+    BannerFormat('HASP', _HASP_REGEX, ('HASP-II*',)),
+    BannerFormat('WTR', _WTR_REGEX, ('*' * 11,)),
+    BannerFormat('ZOS', _ZOS_NOBANNER_REGEX, ('1 /',), no_banner=True),
+    BannerFormat('MVT', _MVT_NOBANNER_REGEX, ('//', 'IEF452I '),
+                 no_banner=True),
+]
+
+
+def RegisterBannerFormat(banner_format):
+  """Add a banner format to those the splitter knows about."""
+  _BANNER_FORMATS.append(banner_format)
+
+
+# Seconds to wait for input before checking for a shutdown request
+_IDLE_TIMEOUT = 10.0
+
+# Bytes requested from the input per read in block mode
+_BLOCK_SIZE = 64 * 1024
+
+# Default thresholds for writing buffered output to a job file
+_FLUSH_BYTES = 256 * 1024
+_FLUSH_SECONDS = 5.0
+
+# Default number of requests which may wait for the writer thread
+_QUEUE_DEPTH = 1024
+
+# File name suffix and default level of each compressed output format
+_COMPRESSION = {
+    'gzip': ('.gz', 6),
+    'zstd': ('.zst', 3),
+}
+
+# Splits a job file name into its base name and numeric suffix
+_SUFFIX_REGEX = re.compile(r'(.+)-(\d+)')
+
+# Default name of the job index database in the spool directory
+_INDEX_NAME = 'spool.db'
+
+# Commit the job index after this many new rows or seconds
+_INDEX_BATCH_ROWS = 100
+_INDEX_BATCH_SECONDS = 10.0
+
+# Most segments the kernel accepts in a single writev() call
+try:
+  _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+  _IOV_MAX = 16
+
+# Zero width match after each line terminator; splitting on this keeps
+# the terminator at the end of each line, as _GetLine does.
+_LINE_END_REGEX = re.compile(r'(?<=[\n\f])')
+
+
 def _EPrint(*text):
   """Print a line to STDERR and flush it."""
   print(f'{os.path.basename(sys.argv[0])}:', *text, file=sys.stderr)
@@ -200,20 +331,28 @@ class GracefulKiller:
       case signal.SIGINT:
         number = 'SIGINT'
 
-      case signal.signal.SIGTERM:
+      case signal.SIGTERM:
         number = 'SIGTERM'
 
     _EPrint(f'Killed by signal {number}.')
     self.kill_now = True
 
-def _GetLine(killer):
+def _WaitTime(idle):
+  """Seconds to wait for input, less if idle() says a flush is due."""
+  due = idle() if idle else None
+  if due is None:
+    return _IDLE_TIMEOUT
+  return min(due, _IDLE_TIMEOUT)
+
+
+def _GetLine(killer, idle=None):
   """Read one line of SYSOUT from the input"""
   line = ''
   c = '?'
 
   while not killer.kill_now and c not in ('\n', '\f', None, ''):
 
-    if select.select([sys.stdin, ], [], [], 10.0)[0]:
+    if select.select([sys.stdin, ], [], [], _WaitTime(idle))[0]:
       # We have data to read
       try:
         c = sys.stdin.read(1)
@@ -229,7 +368,214 @@ def _GetLine(killer):
   return line
 
 
-def _OpenFile(dictionary, sequence, lines_in):
+class _LineSplitter:
+  """Break blocks of raw printer data into lines of SYSOUT.
+
+  Lines end with a new line, a carriage return (which is converted to a
+  new line) or a form feed, exactly as they do for _GetLine.  Any
+  incomplete line at the end of a block is held until the next block.
+  """
+
+  def __init__(self):
+    self.partial = ''
+
+  def Split(self, data):
+    """Return the complete lines in data as a list of strings."""
+    text = data.decode('ascii', errors='replace').replace('\r', '\n')
+    lines = _LINE_END_REGEX.split(self.partial + text)
+    self.partial = lines.pop()
+    return lines
+
+  def Remainder(self):
+    """Return (and forget) any incomplete line."""
+    line, self.partial = self.partial, ''
+    return line
+
+
+class _BlockReader:
+  """Read lines of SYSOUT from a file descriptor in large blocks.
+
+  This replaces a select()/read() pair per character with one pair per
+  block, while keeping the idle wake up needed to honor GracefulKiller
+  and to call idle(), if given, when the writer has a flush due.
+  """
+
+  def __init__(self, killer, fd, block_size=_BLOCK_SIZE, idle=None):
+    self.killer = killer
+    self.fd = fd
+    self.idle = idle
+    self.block_size = block_size
+    self.splitter = _LineSplitter()
+    self.lines = collections.deque()
+    self.eof = False
+
+  def GetLine(self):
+    """Read one line of SYSOUT, returning an empty string at EOF."""
+    while not (self.lines or self.eof or self.killer.kill_now):
+      if select.select([self.fd, ], [], [], _WaitTime(self.idle))[0]:
+        # We have data to read
+        data = os.read(self.fd, self.block_size)
+        if data:
+          self.lines.extend(self.splitter.Split(data))
+        else:
+          self.eof = True
+
+    if self.lines:
+      return self.lines.popleft()
+
+    # At EOF or shutdown, return any partial line (as _GetLine does)
+    return self.splitter.Remainder()
+
+
+class _JobFile:
+  """A job file written with vectored I/O.
+
+  Pages are queued as lists of byte segments (one per line) and written
+  with os.writev() once enough data has accumulated or enough time has
+  passed, rather than being joined into one string and flushed page by
+  page.  If a compressor is supplied, the queued data is passed through
+  it on the way to the file.
+  """
+
+  def __init__(self, name, fd, flush_bytes, flush_seconds, compressor=None):
+    self.name = name
+    self.fd = fd
+    self.flush_bytes = flush_bytes
+    self.flush_seconds = flush_seconds
+    self.compressor = compressor
+    self.bytes = 0
+    self.segments = []
+    self.pending = 0
+    self.last_flush = time.monotonic()
+
+  def Write(self, segments):
+    """Queue a page of byte segments, writing them out if needed."""
+    self.segments.extend(segments)
+    length = sum(map(len, segments))
+    self.pending += length
+    self.bytes += length
+
+    if (self.pending >= self.flush_bytes or
+        time.monotonic() - self.last_flush >= self.flush_seconds):
+      self.Flush()
+
+  def FlushDue(self):
+    """Flush if queued pages have waited too long, reporting the seconds
+    until queued pages will be due, or None if none are queued."""
+    if not self.segments:
+      return None
+
+    due = self.last_flush + self.flush_seconds - time.monotonic()
+    if due > 0:
+      return due
+
+    self.Flush()
+    return None
+
+  def Flush(self):
+    """Write all queued segments to the file."""
+    if self.compressor and self.segments:
+      self._WriteSegments(
+          [self.compressor.compress(b''.join(self.segments))])
+    else:
+      self._WriteSegments(self.segments)
+
+    self.segments = []
+    self.pending = 0
+    self.last_flush = time.monotonic()
+
+  def _WriteSegments(self, segments):
+    """Write a list of byte segments to the file."""
+    index = 0
+
+    while index < len(segments):
+      batch = segments[index:index + _IOV_MAX]
+      written = os.writev(self.fd, batch)
+
+      # Skip past whatever was written; a short write leaves the
+      # unwritten tail of one segment to retry.
+      for segment in batch:
+        if written < len(segment):
+          segments[index] = memoryview(segment)[written:]
+          break
+        written -= len(segment)
+        index += 1
+
+  def Close(self):
+    """Write all queued segments and close the file."""
+    try:
+      self.Flush()
+      if self.compressor:
+        self._WriteSegments([self.compressor.flush()])
+    finally:
+      os.close(self.fd)
+
+
+class _NameAllocator:
+  """Choose unused job file names without probing the file system.
+
+  The highest numeric suffix (base, base-1, base-2, ...) used for each
+  base name in a directory is learned with a single os.scandir() when
+  the directory is first used, and kept up to date as files are created.
+  Files are created with O_EXCL, so a name taken behind our back simply
+  moves us on to the next suffix.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.directories = {}
+
+  @staticmethod
+  def _Scan(directory):
+    """Return the highest suffix in use for each base name in directory."""
+    os.makedirs(directory, exist_ok=True)
+    highest = {}
+
+    def _Note(base, number):
+      highest[base] = max(highest.get(base, -1), number)
+
+    with os.scandir(directory) as entries:
+      for entry in entries:
+        name = entry.name
+        for (suffix, _) in _COMPRESSION.values():
+          name = name.removesuffix(suffix)
+
+        # A class of 0-9 makes base names look like suffixed names, so
+        # record both readings; at worst we skip an unused name.
+        _Note(name, 0)
+        matches = _SUFFIX_REGEX.fullmatch(name)
+        if matches:
+          _Note(matches.group(1), int(matches.group(2)))
+
+    return highest
+
+  def Create(self, directory, base, suffix):
+    """Create a new job file, returning its name and file descriptor."""
+    key = os.path.abspath(directory)
+    with self.lock:
+      if key not in self.directories:
+        self.directories[key] = self._Scan(directory)
+      highest = self.directories[key]
+
+      number = highest.get(base, -1) + 1
+      while True:
+        name = os.path.join(directory,
+                            f'{base}-{number}{suffix}' if number
+                            else f'{base}{suffix}')
+        try:
+          fd = os.open(name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+          break
+        except FileExistsError:
+          number += 1
+
+      highest[base] = number
+      return (name, fd)
+
+
+_NAMES = _NameAllocator()
+
+
+def _OpenFile(dictionary, sequence, lines_in, keywords, directory=''):
   """Open a new spool based on provided job information."""
   if not dictionary:
     # Fake job information since none provided
@@ -244,8 +590,7 @@ def _OpenFile(dictionary, sequence, lines_in):
       if value and not key in dictionary:
         dictionary[key] = value
 
-  if not os.path.exists(dictionary['queue']):
-    os.makedirs(dictionary['queue'])
+  queue_directory = os.path.join(directory, dictionary['queue'])
 
   output_base = ''.join((
       dictionary['jobname'].replace('$', '_').replace('/', '-'),
@@ -258,17 +603,36 @@ def _OpenFile(dictionary, sequence, lines_in):
       '-',
       dictionary['class'])).replace(' ', '')
 
-  output_base = '/'.join((dictionary['queue'], output_base))
+  if keywords['compress']:
+    (suffix, level) = _COMPRESSION[keywords['compress']]
+    if keywords['compress_level'] is not None:
+      level = keywords['compress_level']
+  else:
+    (suffix, level) = ('', None)
 
-  output_name = output_base
-  for i in range(1, 1000):
-    if not os.path.exists(output_name):
-      break
-    output_name = output_base + '-' + str(i)
+  (output_name, fd) = _NAMES.Create(queue_directory, output_base, suffix)
 
   _EPrint('Opening file', output_name,
           'after', lines_in or 'no', 'total input lines')
-  return open(output_name, 'w', encoding='utf-8')
+  return _JobFile(output_name,
+                  fd,
+                  keywords['flush_bytes'],
+                  keywords['flush_seconds'],
+                  _MakeCompressor(keywords['compress'], level))
+
+
+def _MakeCompressor(method, level):
+  """Create a streaming compressor for a job file, or None if not needed."""
+  match method:
+
+    case 'gzip':
+      # wbits of 31 writes a complete gzip member, not a bare zlib stream
+      return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    case 'zstd':
+      return zstandard.ZstdCompressor(level=level).compressobj()
+
+  return None
 
 def _CloseFile(file_handle, lines_out, lines_in):
   """Close a file handle if needed."""
@@ -278,113 +642,744 @@ def _CloseFile(file_handle, lines_out, lines_in):
             'with',
             lines_out or "no", 'lines written (total has had',
             lines_in or "no", "input lines)")
-    file_handle.close()
-
-def _ScanForBanner(line, new_page, last_regex):
+    file_handle.Close()
+
+class _SpoolIndex:
+  """An SQLite database with one row per job file written.
+
+  Rows are committed in batches, and the database is opened by the first
+  thread to add a row, which is the writer thread unless --queue_depth
+  is 0, so maintaining the index never blocks reading the printer.
+  """
+
+  _SCHEMA = (
+      'CREATE TABLE IF NOT EXISTS jobs ('
+      'file TEXT, queue TEXT, number TEXT, jobname TEXT, class TEXT, '
+      'room TEXT, node TEXT, programmer TEXT, bytes INTEGER, '
+      'lines INTEGER, opened TEXT, closed TEXT)'
+  )
+  _INSERT = 'INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+
+  def __init__(self, path):
+    self.path = path
+    self.connection = None
+    self.rows = []
+    self.last_commit = time.monotonic()
+
+  def Add(self, file_handle, dictionary, lines, opened):
+    """Record a closed job file, committing the batch if it is due."""
+    fields = [(dictionary.get(key) or '').strip()
+              for key in ('queue', 'number', 'jobname', 'class',
+                          'room', 'node', 'pgmr')]
+    self.rows.append((file_handle.name, *fields, file_handle.bytes, lines,
+                      opened, datetime.now().isoformat(timespec='seconds')))
+
+    if (len(self.rows) >= _INDEX_BATCH_ROWS or
+        time.monotonic() - self.last_commit >= _INDEX_BATCH_SECONDS):
+      self.Commit()
+
+  def CommitDue(self):
+    """Commit if pending rows have waited too long, reporting the seconds
+    until pending rows will be due, or None if none are pending."""
+    if not self.rows:
+      return None
+
+    due = self.last_commit + _INDEX_BATCH_SECONDS - time.monotonic()
+    if due > 0:
+      return due
+
+    self.Commit()
+    return None
+
+  def Commit(self):
+    """Write any pending rows to the database."""
+    if self.rows:
+      if not self.connection:
+        # Other printers' writers may be using the same database
+        self.connection = sqlite3.connect(self.path, timeout=60.0)
+        self.connection.execute(self._SCHEMA)
+      with self.connection:
+        self.connection.executemany(self._INSERT, self.rows)
+      self.rows = []
+    self.last_commit = time.monotonic()
+
+  def Close(self):
+    """Commit any pending rows and close the database."""
+    self.Commit()
+    if self.connection:
+      self.connection.close()
+      self.connection = None
+
+
+class _Writer:
+  """Perform the disk writes for job files on the calling thread."""
+
+  def __init__(self, keywords, directory=''):
+    self.keywords = keywords
+    self.directory = directory
+    self.file_handle = None
+    self.dictionary = None
+    self.opened = None
+    if keywords['index']:
+      self.index = _SpoolIndex(keywords['index'])
+    else:
+      self.index = None
+
+  def Open(self, dictionary, sequence, lines_in):
+    """Open a new job file."""
+    self.file_handle = _OpenFile(dictionary,
+                                 sequence,
+                                 lines_in,
+                                 self.keywords,
+                                 self.directory)
+    self.dictionary = dictionary
+    self.opened = datetime.now().isoformat(timespec='seconds')
+
+  def Write(self, segments):
+    """Write a page of byte segments to the current job file."""
+    self.file_handle.Write(segments)
+
+  def Close(self, lines_out, lines_in):
+    """Close the current job file, if any."""
+    _CloseFile(self.file_handle, lines_out, lines_in)
+    if self.file_handle and self.index:
+      self.index.Add(self.file_handle, self.dictionary, lines_out, self.opened)
+    self.file_handle = None
+
+  def Idle(self):
+    """Write queued pages if --flush_seconds have passed, and commit index
+    rows if their batch time has, reporting the seconds until the next
+    check is needed, or None if not needed."""
+    dues = []
+    if self.file_handle:
+      dues.append(self.file_handle.FlushDue())
+    if self.index:
+      dues.append(self.index.CommitDue())
+    return min((due for due in dues if due is not None), default=None)
+
+  def Shutdown(self):
+    """Finish all writes."""
+    if self.index:
+      self.index.Close()
+
+  def Report(self):
+    """Log writer statistics."""
+
+
+class _ThreadedWriter:
+  """Perform the disk writes for job files on a background thread.
+
+  Requests reach the writer through a bounded queue, so a slow disk
+  does not stall reading the printer until the queue fills.  When it is
+  full the reader waits; how often and how long is reported at shutdown.
+  """
+
+  def __init__(self, keywords, depth, directory=''):
+    self.writer = _Writer(keywords, directory)
+    self.depth = depth
+    self.queue = queue.Queue(maxsize=depth)
+    self.error = None
+    self.requests = 0
+    self.waits = 0
+    self.wait_seconds = 0.0
+    self.high_water = 0
+    self.thread = threading.Thread(target=self._Run,
+                                   name='writer',
+                                   daemon=True)
+    self.thread.start()
+
+  def _Run(self):
+    """Writer thread main loop; runs requests until told to stop.
+
+    While waiting for requests, queued pages are still written once
+    --flush_seconds have passed.
+    """
+    timeout = None
+    while True:
+      try:
+        request = self.queue.get(timeout=timeout)
+      except queue.Empty:
+        request = (self.writer.Idle, ())
+      if request is None:
+        break
+
+      (method, args) = request
+      if self.error:
+        # Once broken, discard everything until the reader notices.
+        continue
+      try:
+        method(*args)
+        timeout = self.writer.Idle()
+      except Exception as ex:             # pylint: disable=W0718
+        _EPrint('Writer failed:', ex)
+        self.error = ex
+
+  def _Put(self, request):
+    """Pass a request to the writer thread, waiting if the queue is full."""
+    if self.error:
+      raise self.error
+
+    self.requests += 1
+    try:
+      self.queue.put_nowait(request)
+    except queue.Full:
+      self.waits += 1
+      start = time.monotonic()
+      self.queue.put(request)
+      self.wait_seconds += time.monotonic() - start
+
+    self.high_water = max(self.high_water, self.queue.qsize())
+
+  def Open(self, dictionary, sequence, lines_in):
+    """Open a new job file."""
+    self._Put((self.writer.Open, (dictionary, sequence, lines_in)))
+
+  def Write(self, segments):
+    """Write a page of byte segments to the current job file."""
+    self._Put((self.writer.Write, (segments,)))
+
+  def Close(self, lines_out, lines_in):
+    """Close the current job file, if any."""
+    self._Put((self.writer.Close, (lines_out, lines_in)))
+
+  def Idle(self):
+    """Nothing to do; the writer thread writes queued pages when due."""
+    return None
+
+  def Shutdown(self):
+    """Finish all queued writes and stop the writer thread."""
+    self.queue.put((self.writer.Shutdown, ()))
+    self.queue.put(None)
+    self.thread.join()
+    if self.error:
+      raise self.error
+
+  def Report(self):
+    """Log queue statistics."""
+    _EPrint('Writer queue handled',
+            self.requests or 'no', 'requests, high water',
+            self.high_water, f'of {self.depth}; reader waited',
+            self.waits or 'no', f'times for {self.wait_seconds:.3f} seconds')
+
+
+class _BannerScanner:
+  """The enabled banner formats and the state of our search for them.
+
+  Formats are kept ordered by hit rate, so the format a given printer
+  actually uses is tried first.
+  """
+
+  def __init__(self, disabled=()):
+    # Each printer counts its own hits, so it orders formats by its own use
+    enabled = [banner.Copy() for banner in _BANNER_FORMATS
+               if banner.name not in disabled]
+    self.banners = [banner for banner in enabled if not banner.no_banner]
+    self.no_banners = [banner for banner in enabled if banner.no_banner]
+    self.last = None
+
+    # First character of any line which could possibly be a banner
+    self.leads = frozenset(prefix[0]
+                           for banner in enabled
+                           for prefix in banner.prefixes)
+
+  def Matched(self, banner):
+    """Remember the format which matched and reorder all by hit rate."""
+    self.last = banner
+    for formats in (self.banners, self.no_banners):
+      formats.sort(key=BannerFormat.HitRate, reverse=True)
+
+  def Report(self):
+    """Log the hit counts of each format."""
+    for banner in self.banners + self.no_banners:
+      _EPrint(f'Banner format {banner.name} matched',
+              banner.matched or 'no', 'of',
+              banner.tested or 'no', 'lines tested')
+
+
+def _ScanForBanner(line, new_page, scanner):
   """Scan current line for a banner text."""
-  if not line.strip():
-    return (None, last_regex)
+  text = line.strip()
+
+  # Quickly reject blank lines and anything else not starting like a banner
+  if text[:1] not in scanner.leads:
+    return None
 
-  regex_list = [_JES2_REGEX, _HASP_REGEX, _WTR_REGEX]
+  formats = scanner.banners
 
   # Only search for the raw JCL starting a job if starting a page AND
   # we not yet seen a real banner page.
   if new_page:
-    if last_regex:
-      regex_list.append(last_regex)
+    if scanner.last:
+      formats = formats + [scanner.last]
     else:
-      regex_list.append(_ZOS_NOBANNER_REGEX)
-      regex_list.append(_MVT_NOBANNER_REGEX)
+      formats = formats + scanner.no_banners
 
-  for regex in regex_list:
-    matches = re.match(regex, line.strip())
-    if matches:
-      dictionary = matches.groupdict()
-      return (dictionary, regex)
+  for banner in formats:
+    dictionary = banner.Parse(text)
+    if dictionary is not None:
+      scanner.Matched(banner)
+      return dictionary
 
-  return (None, last_regex)
+  return None
 
 
-def _Process():
-  """Main processing loop.  Never exits until program shutdown."""
-  page_buffer = []
-  banner_page = False
-  new_page = False
-  form_feed = False
-  file_handle = None
-  lines_out = 0
-  lines_in = 0
-  line = True
-  killer = GracefulKiller()
+class _Printer:
+  """Split the output of one printer into job files, a line at a time."""
 
-  last_regex = None
-  sequence = 10000
-
-  while line:
-    line = _GetLine(killer)
-    new_page = form_feed
-    form_feed = '\f' in line
-
-    # At EOF, write any current page (unless a banner page) and exit
-    if killer.kill_now or not line:
-      if page_buffer and not banner_page:
-        if not file_handle:
-          file_handle = _OpenFile({}, sequence + 1, lines_in)
-        file_handle.write(''.join(page_buffer))
-        _CloseFile(file_handle, lines_out, lines_in)
-        lines_out = 0
-      return
+  def __init__(self, writer, scanner):
+    self.writer = writer
+    self.scanner = scanner
+    self.sequence = 10000
+    self._Reset()
+
+  def _Reset(self):
+    """Forget the current page and job, as at the start of input."""
+    self.page_buffer = []
+    self.banner_page = False
+    self.form_feed = False
+    self.file_open = False
+    self.lines_out = 0
+    self.lines_in = 0
 
-    lines_in += 1
-    lines_out += 1
+  def Feed(self, line):
+    """Process one line of printer output."""
+    new_page = self.form_feed
+    self.form_feed = '\f' in line
+
+    self.lines_in += 1
+    self.lines_out += 1
 
     #  print/flush any previous page when we see top of form
-    if '\f' in line and (page_buffer and page_buffer != ['\n']):
-      if banner_page:
+    if '\f' in line and (self.page_buffer and self.page_buffer != [b'\n']):
+      if self.banner_page:
         # We ignore (not print) banner pages
-        banner_page = False
+        self.banner_page = False
       else:
-        if not file_handle:
+        if not self.file_open:
           # If input did not start with a banner page, we need to
           # open an anonymous file now that we have the first page
-          _EPrint('New file for:\n', '->'.join(page_buffer))
-          sequence = sequence + 1
-          file_handle = _OpenFile({}, sequence, lines_in)
+          _EPrint('New file for:\n',
+                  b'->'.join(self.page_buffer).decode('utf-8'))
+          self.sequence += 1
+          self.writer.Open({}, self.sequence, self.lines_in)
+          self.file_open = True
 
-        file_handle.write(''.join(page_buffer))
-        file_handle.flush()
+        self.writer.Write(self.page_buffer)
 
       # Having printed/discarded the previous page, start a new one
-      page_buffer = []
+      self.page_buffer = []
 
-    page_buffer.append(line)
+    self.page_buffer.append(line.encode('utf-8'))
 
     # Look for a banner which starts or ends a new file.
-    if not banner_page:
-      (dictionary, last_regex) = _ScanForBanner(line, new_page, last_regex)
+    if not self.banner_page:
+      dictionary = _ScanForBanner(line, new_page, self.scanner)
 
       if dictionary:
         # If a match, we have a banner page which may need a new file
-        banner_page = 'edge' in dictionary
-        _CloseFile(file_handle, lines_out, lines_in)
-        lines_out = 0
-        file_handle = None
+        self.banner_page = 'edge' in dictionary
+        if self.file_open:
+          self.writer.Close(self.lines_out, self.lines_in)
+        self.lines_out = 0
+        self.file_open = False
 
         # We only open files for START banner pages; at the end of jobs,
         # we ignore it, having already closed the file.
-        if not banner_page or 'END' not in dictionary['edge']:
-          sequence += 1
-          file_handle = _OpenFile(dictionary, sequence, lines_in)
-          dictionary = None
+        if not self.banner_page or 'END' not in dictionary['edge']:
+          self.sequence += 1
+          self.writer.Open(dictionary, self.sequence, self.lines_in)
+          self.file_open = True
+
+  def Finish(self):
+    """At EOF, write any current page (unless a banner page) and close
+    any open file, even one just opened by a trailing START banner."""
+    if self.page_buffer and not self.banner_page:
+      if not self.file_open:
+        self.writer.Open({}, self.sequence + 1, self.lines_in)
+        self.file_open = True
+      self.writer.Write(self.page_buffer)
+    if self.file_open:
+      self.writer.Close(self.lines_out, self.lines_in)
+    self._Reset()
+
+
+def _MakeWriter(keywords, directory=''):
+  """Create the writer for a printer's job files."""
+  if keywords['queue_depth']:
+    return _ThreadedWriter(keywords, keywords['queue_depth'], directory)
+  return _Writer(keywords, directory)
+
+
+def _Process(keywords):
+  """Main processing loop.  Never exits until program shutdown."""
+  killer = GracefulKiller()
+
+  writer = _MakeWriter(keywords)
+
+  if keywords['block_size']:
+    get_line = _BlockReader(killer,
+                            sys.stdin.fileno(),
+                            keywords['block_size'],
+                            writer.Idle).GetLine
+  else:
+    get_line = lambda: _GetLine(killer, writer.Idle)
+
+  scanner = _BannerScanner(keywords['disable_format'])
+  printer = _Printer(writer, scanner)
+
+  try:
+    while (line := get_line()) and not killer.kill_now:
+      printer.Feed(line)
+    printer.Finish()
+  finally:
+    writer.Shutdown()
+    writer.Report()
+    scanner.Report()
+
+
+class _PrinterSource:
+  """One printer served by the daemon and where its output comes from.
+
+  The source is either the address of a Hercules socket device printer,
+  which we connect to, or a FIFO which Hercules writes to.  Either is
+  reopened after Hercules closes it.  Connecting does not block, so an
+  unreachable printer does not hold up reading the others.
+  """
+
+  def __init__(self, source, directory, keywords, selector):
+    self.name = source
+    self.directory = directory
+    self.block_size = keywords['block_size'] or _BLOCK_SIZE
+    self.selector = selector
+    (host, _, port) = source.rpartition(':')
+    if host and port.isdigit() and not os.path.exists(source):
+      self.address = (host, int(port))
+    else:
+      self.address = None
+    self.connection = None
+    self.connecting = False
+    self.connect_deadline = 0.0
+    self.retry_time = 0.0
+    self.failed = False
+    self.splitter = _LineSplitter()
+    self.writer = _MakeWriter(keywords, directory)
+    self.scanner = _BannerScanner(keywords['disable_format'])
+    self.printer = _Printer(self.writer, self.scanner)
+
+    os.makedirs(directory, exist_ok=True)
+
+  def Open(self):
+    """Connect to the printer if not connected and it's time to retry."""
+    if self.connecting and time.monotonic() >= self.connect_deadline:
+      self._Abandon(TimeoutError(errno.ETIMEDOUT, 'Connection timed out'))
+    if self.connection is not None or time.monotonic() < self.retry_time:
+      return
+
+    try:
+      if self.address:
+        self._Connect()
+        return
+      self.connection = os.open(self.name, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError as ex:
+      self._Failed(ex)
+      return
+
+    self._Opened()
+
+  def _Connect(self):
+    """Start connecting to a socket device printer, without waiting."""
+    (family, kind, protocol, _, address) = socket.getaddrinfo(
+        *self.address, type=socket.SOCK_STREAM)[0]
+    connection = socket.socket(family, kind, protocol)
+    connection.setblocking(False)
+    error = connection.connect_ex(address)
+    if error not in (0, errno.EINPROGRESS):
+      connection.close()
+      raise OSError(error, os.strerror(error))
+
+    self.connection = connection
+    self.connecting = True
+    self.connect_deadline = time.monotonic() + _IDLE_TIMEOUT
+    self.selector.register(connection, selectors.EVENT_WRITE, self)
+
+  def _Connected(self):
+    """Finish connecting, once the socket is writable."""
+    error = self.connection.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+    if error:
+      self._Abandon(OSError(error, os.strerror(error)))
+      return
+
+    self.connecting = False
+    self.selector.unregister(self.connection)
+    self._Opened()
+
+  def _Abandon(self, ex):
+    """Give up on a connection which has not completed."""
+    self.selector.unregister(self.connection)
+    self.connection.close()
+    self.connection = None
+    self.connecting = False
+    self._Failed(ex)
+
+  def _Failed(self, ex):
+    """Report a failure to open the printer and when to retry."""
+    # Only report the first of a series of failures
+    if not self.failed:
+      _EPrint('Printer', self.name, 'not available:', ex)
+    self.failed = True
+    self.retry_time = time.monotonic() + _IDLE_TIMEOUT
+
+  def _Opened(self):
+    """Start reading the printer just opened."""
+    self.failed = False
+    _EPrint('Printer', self.name, 'opened, writing jobs into', self.directory)
+    self.selector.register(self.connection, selectors.EVENT_READ, self)
+
+  def Idle(self):
+    """Write any queued pages due, reporting the seconds until this
+    printer next needs attention, or None if only when it sends data."""
+    due = self.writer.Idle()
+    if self.connecting:
+      remaining = max(self.connect_deadline - time.monotonic(), 0)
+      due = remaining if due is None else min(due, remaining)
+    return due
+
+  def Read(self):
+    """Process whatever the printer has sent us."""
+    if self.connecting:
+      self._Connected()
+      return
+
+    try:
+      if self.address:
+        data = self.connection.recv(self.block_size)
+      else:
+        data = os.read(self.connection, self.block_size)
+    except BlockingIOError:
+      return
+    except OSError as ex:
+      _EPrint('Printer', self.name, 'read failed:', ex)
+      data = b''
+
+    if not data:
+      self.Close()
+      return
+
+    for line in self.splitter.Split(data):
+      self.printer.Feed(line)
+
+  def Close(self):
+    """Finish the current job and close the connection to the printer."""
+    if self.connecting:
+      self._Abandon(ConnectionAbortedError('Shutting down'))
+    if self.connection is None:
+      return
+
+    line = self.splitter.Remainder()
+    if line:
+      self.printer.Feed(line)
+    self.printer.Finish()
+
+    self.selector.unregister(self.connection)
+    if self.address:
+      self.connection.close()
+    else:
+      os.close(self.connection)
+    self.connection = None
+    _EPrint('Printer', self.name, 'closed')
+
+  def Shutdown(self):
+    """Close the printer and finish writing its job files."""
+    try:
+      self.Close()
+    finally:
+      self.writer.Shutdown()
+      _EPrint('Statistics for printer', self.name)
+      self.writer.Report()
+      self.scanner.Report()
+
+
+def _Daemon(keywords):
+  """Serve all the printers on the command line until program shutdown."""
+  killer = GracefulKiller()
+  selector = selectors.DefaultSelector()
+  sources = [_PrinterSource(source, directory, keywords, selector)
+             for (source, directory) in keywords['printer']]
+
+  try:
+    while not killer.kill_now:
+      for source in sources:
+        source.Open()
+
+      timeout = min((due for due in (source.Idle() for source in sources)
+                     if due is not None),
+                    default=_IDLE_TIMEOUT)
+      for (key, _) in selector.select(min(timeout, _IDLE_TIMEOUT)):
+        key.data.Read()
+  finally:
+    for source in sources:
+      source.Shutdown()
+    selector.close()
+
+
+def _ParseCommandLine(command_line):
+  """Parse program arguments"""
+
+  def _NonNegativeInteger(value):
+    """Convert passed value to a non-negative integer and verify it."""
+    ivalue = int(value)
+    if ivalue < 0:
+      raise argparse.ArgumentTypeError(
+          f'{value} is not a non-negative int value')
+    return ivalue
+
+  def _NonNegativeFloat(value):
+    """Convert passed value to a non-negative float and verify it."""
+    fvalue = float(value)
+    if fvalue < 0:
+      raise argparse.ArgumentTypeError(
+          f'{value} is not a non-negative value')
+    return fvalue
+
+  def _PrinterSpecification(value):
+    """Split a SOURCE[=DIRECTORY] printer specification."""
+    (source, _, directory) = value.partition('=')
+    if not source:
+      raise argparse.ArgumentTypeError(
+          f'"{value}" does not name a printer')
+    if not directory:
+      directory = os.path.basename(source).replace(':', '-')
+    return (source, directory)
+
+  parser = argparse.ArgumentParser(
+      description='Split Hercules printer output read from standard input '
+      'into individual files based on HASP/JES2 banner pages.',
+      epilog=__copyright__
+  )
+  parser.add_argument(
+      'directory',
+      nargs='?',
+      default='print',
+      help='Spool directory to write job files into. '
+      '(Default: %(default)s)',
+  )
+  parser.add_argument(
+      '-b',
+      '--block_size',
+      default=_BLOCK_SIZE,
+      metavar='BYTES',
+      help='Number of bytes to read from the printer at a time; '
+      '0 reads one character at a time (the original, slow, behavior). '
+      '(Default: %(default)s)',
+      type=_NonNegativeInteger,
+  )
+  parser.add_argument(
+      '-f',
+      '--flush_bytes',
+      default=_FLUSH_BYTES,
+      metavar='BYTES',
+      help='Write buffered pages to the current job file once at least '
+      'this many bytes are queued; 0 writes every page as it completes. '
+      '(Default: %(default)s)',
+      type=_NonNegativeInteger,
+  )
+  parser.add_argument(
+      '-F',
+      '--flush_seconds',
+      default=_FLUSH_SECONDS,
+      metavar='SECONDS',
+      help='Write buffered pages to the current job file once this many '
+      'seconds have passed since it was last written. '
+      '(Default: %(default)s)',
+      type=_NonNegativeFloat,
+  )
+  parser.add_argument(
+      '-q',
+      '--queue_depth',
+      default=_QUEUE_DEPTH,
+      metavar='REQUESTS',
+      help='Write job files on a background thread, letting up to this '
+      'many pages wait for it before reading the printer pauses; '
+      '0 writes job files on the thread reading the printer. '
+      '(Default: %(default)s)',
+      type=_NonNegativeInteger,
+  )
+  parser.add_argument(
+      '-z',
+      '--compress',
+      default=None,
+      choices=list(_COMPRESSION),
+      help='Compress each job file as it is written.  Compression runs '
+      'on the writer thread, so it does not slow reading the printer '
+      'unless --queue_depth is 0.  zstd requires the zstandard module. '
+      '(Default: no compression)',
+  )
+  parser.add_argument(
+      '-Z',
+      '--compress_level',
+      default=None,
+      metavar='LEVEL',
+      help='Compression level, 1 (fastest) to 9 for gzip or 1 to 22 '
+      'for zstd. '
+      '(Default: ' +
+      ', '.join(f'{level} for {method}'
+                for (method, (_, level)) in _COMPRESSION.items()) + ')',
+      type=int,
+  )
+  parser.add_argument(
+      '-i',
+      '--index',
+      default=_INDEX_NAME,
+      metavar='DATABASE',
+      help='SQLite database (relative to the spool directory) to record '
+      'each job file written in; an empty name disables the index. '
+      '(Default: %(default)s)',
+  )
+  parser.add_argument(
+      '-P',
+      '--printer',
+      action='append',
+      default=[],
+      metavar='SOURCE[=DIRECTORY]',
+      help='Run as a daemon serving this printer instead of reading '
+      'standard input; may be repeated.  SOURCE is either HOST:PORT of a '
+      'Hercules socket device printer or the path of a FIFO Hercules '
+      'prints to.  Jobs are written into DIRECTORY under the spool '
+      'directory. '
+      '(Default: a directory named after the source)',
+      type=_PrinterSpecification,
+  )
+  parser.add_argument(
+      '-D',
+      '--disable_format',
+      action='append',
+      default=[],
+      choices=[banner.name for banner in _BANNER_FORMATS],
+      metavar='FORMAT',
+      help='Do not look for banners of this format, for example WTR on '
+      'a JES2 system; may be repeated.  Formats are: '
+      f'{", ".join(banner.name for banner in _BANNER_FORMATS)}. '
+      '(Default: none disabled)',
+  )
+  args = parser.parse_args(command_line)
+
+  if args.compress == 'zstd' and not zstandard:
+    parser.error('zstd compression requires the zstandard module')
+  if args.compress_level is not None:
+    limit = {'gzip': 9, 'zstd': 22}.get(args.compress, 0)
+    if not 1 <= args.compress_level <= limit:
+      parser.error(f'compression level {args.compress_level} is not '
+                   f'valid for {args.compress or "uncompressed output"}')
+
+  return args
+
 
 def Main():
   """Main program to invoke _Process."""
   _EPrint('Version', __version__, 'Started ...')
 
-  if len(sys.argv) > 1:
-    directory = sys.argv[1]
-  else:
-    directory = 'print'
+  keywords = vars(_ParseCommandLine(sys.argv[1:]))
+  directory = keywords['directory']
 
   sys.stdin.reconfigure(encoding='ascii', errors='replace')
 
@@ -395,7 +1390,10 @@ def Main():
 
   os.chdir(directory)
   _EPrint('Current spool directory now', os.getcwd())
-  _Process()
+  if keywords['printer']:
+    _Daemon(keywords)
+  else:
+    _Process(keywords)
   _EPrint('EOF!\n')
 
 if __name__ == '__main__':
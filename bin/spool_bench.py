@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+
+#         vim:  ts=2 sw=2 expandtab
+
+"""Measure the throughput of spool.py without a running Hercules.
+
+A recorded printer stream (for example, captured with
+
+    000E    1403    |tee printer.raw | ../common/spool.py
+
+) or a synthetic stream mixing JES2, HASP-II and MVT WTR banner pages,
+MVT jobs without banners, form feeds, and CR-only line ends is fed
+through the same _Process loop spool.py uses in production.
+
+The stream is processed twice: once untouched to measure lines and bytes
+per second, and once instrumented to report the time spent scanning for
+banners versus reading input and writing job files, and peak memory.
+The instrumented run writes job files on the reading thread (as with
+--queue_depth 0), so the parts timed are shares of one thread's time.
+
+To catch changes in how jobs are split, the job files written can be
+compared with (or saved as) a golden copy:
+
+    spool_bench.py --synthetic 500 --update_golden golden/
+    spool_bench.py --synthetic 500 --golden golden/
+
+Any options not listed below are passed on to spool.py itself.
+"""
+
+__author__ = "ahd@kew.com (Drew Derbyshire)"
+__version__ = "1.0.0"
+__copyright__ = ('Version ' + __version__ + '. '
+                 'Copyright 2024 by Kendra Electronic Wonderworks. '
+                 'All commercial rights reserved.\n'
+                )
+
+import argparse
+import collections
+import datetime
+import filecmp
+import functools
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import spool
+
+# Jobs in a synthetic stream if no recorded stream is given
+_SYNTHETIC_JOBS = 200
+
+# Fixed time used for the names of jobs without banners, so the job
+# files written are the same from run to run.
+_FIXED_TIME = datetime.datetime(2016, 11, 18, 15, 52, 41)
+
+# pylint: disable=C0301
+_JES2_BANNER = ('****{sysout}  {edge}  JOB {number:4d}  {jobname:8.8s}  '
+                'A.H.DERBYSHIRE        ROOM TSO    3.52.41 PM 18 NOV 15  '
+                'PRINTER1  SYS KEWS  JOB {number:4d}  {edge}  {sysout}****')
+_HASP_BANNER = ('HASP-II*{sysout}*PRINTER1....{edge} JOB {number:4d}....'
+                '11.03.49 AM  3 MAR 95....ROOM     ....{jobname:8.8s}....'
+                'DERBYSHIRE          ....PRINTER1*{sysout}*HASP-II')
+_WTR_BANNER = ('***********{sysout}  {edge}   {jobname:8.8s}   SYS SYSA   '
+               'WTR 00E   07:38:43 PM  28 AUG 1978   WTR 00E   SYS SYSA   '
+               '{jobname:8.8s}   {edge}  {sysout}***********')
+
+# Banner template and the start and end edge text of each banner format
+_BANNERS = (
+    (_JES2_BANNER, 'START', ' END '),
+    (_HASP_BANNER, 'START', '..END'),
+    (_WTR_BANNER, 'START', '..END'),
+)
+
+
+class _FixedDateTime(datetime.datetime):
+  """A datetime whose now() never changes."""
+
+  @classmethod
+  def now(cls, tz=None):
+    return _FIXED_TIME
+
+
+def _Synthetic(jobs, seed):
+  """Generate a printer stream of the given number of jobs."""
+  generator = random.Random(seed)
+  output = []
+
+  def _Page(lines, ending):
+    output.append('\f')
+    output.extend(line + ending for line in lines)
+
+  def _Listing(lines):
+    return [f'  {line:5d}  IEF236I ALLOC. FOR STEP{line % 7}  '
+            f'{"SYSPRINT" if line % 3 else "SYSUT1  "}  '
+            f'{generator.choice(("", "VOLUME SER NOS= WORK01"))}'
+            for line in range(lines)]
+
+  # MVT without HASP prints no banners, only the JOB card
+  for _ in range(min(jobs, 3)):
+    _Page([f'//MVT{generator.randint(0, 999):03d} JOB MSGLEVEL=1'] +
+          _Listing(generator.randint(1, 50)),
+          '\n')
+
+  for _ in range(jobs):
+    (template, start, end) = generator.choice(_BANNERS)
+    fields = {
+        'sysout': generator.choice('AX1'),
+        'number': generator.randint(1, 9999),
+        'jobname': generator.choice(('AHDLSCAT', 'MVS0080', 'FOO$BAR',
+                                     'IEBGENER', 'COMPILE')),
+    }
+    ending = generator.choice(('\n', '\r', '\r\n'))
+    _Page([template.format(edge=start, **fields)] * 3, ending)
+    for _ in range(generator.randint(1, 6)):
+      _Page(_Listing(generator.randint(0, 60)), ending)
+    _Page([template.format(edge=end, **fields)] * 3, ending)
+
+  return ''.join(output).encode('ascii')
+
+
+def _Timed(function, totals, key, nested):
+  """Wrap function to add the time spent in it to totals[key].
+
+  Time spent in other timed functions it calls (Close calling Flush, or
+  GetLine flushing an idle job file) counts only toward their own keys;
+  nested holds the time taken by such calls for each active wrapper.
+  """
+
+  @functools.wraps(function)
+  def _Wrapper(*args, **kwargs):
+    start = time.perf_counter()
+    nested.append(0.0)
+    try:
+      return function(*args, **kwargs)
+    finally:
+      elapsed = time.perf_counter() - start
+      totals[key] += elapsed - nested.pop()
+      if nested:
+        nested[-1] += elapsed
+
+  return _Wrapper
+
+
+def _Instrument(totals):
+  """Time the interesting parts of spool.py, returning an undo list."""
+  targets = (
+      (spool, '_ScanForBanner', 'banner scan'),
+      (spool._BlockReader, 'GetLine', 'input'),
+      (spool._NameAllocator, 'Create', 'output'),
+      (spool._JobFile, 'Flush', 'output'),
+      (spool._JobFile, 'Close', 'output'),
+  )
+  undo = []
+  nested = []
+  for (owner, name, key) in targets:
+    original = getattr(owner, name)
+    undo.append((owner, name, original))
+    setattr(owner, name, _Timed(original, totals, key, nested))
+  return undo
+
+
+def _Run(stream_path, output, spool_arguments):
+  """Feed the stream through spool._Process, writing into output."""
+  keywords = vars(spool._ParseCommandLine(spool_arguments + [output]))
+  os.makedirs(output)
+  saved_stdin = os.dup(0)
+  saved_text = sys.stdin
+  saved_directory = os.getcwd()
+
+  try:
+    with open(stream_path, 'rb') as stream:
+      os.dup2(stream.fileno(), 0)
+    # What Main() does to sys.stdin, for the per-character reader
+    sys.stdin = open(0,                   # pylint: disable=R1732
+                     encoding='ascii',
+                     errors='replace',
+                     newline='\n',
+                     closefd=False)
+    os.chdir(output)
+    start = time.perf_counter()
+    spool._Process(keywords)
+    return time.perf_counter() - start
+  finally:
+    os.chdir(saved_directory)
+    sys.stdin.close()
+    sys.stdin = saved_text
+    os.dup2(saved_stdin, 0)
+    os.close(saved_stdin)
+
+
+def _CompareTrees(golden, output, index):
+  """Return a list of differences between two job file trees."""
+  differences = []
+
+  def _Compare(comparison, prefix):
+    for name in comparison.left_only:
+      differences.append(f'missing {prefix}{name}')
+    for name in comparison.right_only:
+      if prefix or name != index:
+        differences.append(f'unexpected {prefix}{name}')
+    (_, mismatch, errors) = filecmp.cmpfiles(comparison.left,
+                                             comparison.right,
+                                             comparison.common_files,
+                                             shallow=False)
+    differences.extend(f'changed {prefix}{name}'
+                       for name in mismatch + errors)
+    for (name, subdirectory) in comparison.subdirs.items():
+      _Compare(subdirectory, f'{prefix}{name}/')
+
+  _Compare(filecmp.dircmp(golden, output, ignore=[index]), '')
+  return differences
+
+
+def _ParseCommandLine(command_line):
+  """Parse program arguments, returning ours and those for spool.py"""
+
+  def _PositiveInteger(value):
+    """Convert passed value to a positive integer and verify it."""
+    ivalue = int(value)
+    if ivalue <= 0:
+      raise argparse.ArgumentTypeError(
+          f'{value} is not a positive int value')
+    return ivalue
+
+  parser = argparse.ArgumentParser(
+      description='Measure spool.py throughput using a recorded or '
+      'synthetic printer stream.',
+      epilog=__copyright__
+  )
+  source = parser.add_mutually_exclusive_group()
+  source.add_argument(
+      '-s',
+      '--stream',
+      metavar='FILE',
+      help='Recorded raw printer output to process. '
+      '(Default: a synthetic stream)',
+  )
+  source.add_argument(
+      '-j',
+      '--synthetic',
+      default=_SYNTHETIC_JOBS,
+      metavar='JOBS',
+      help='Number of jobs in the synthetic stream. '
+      '(Default: %(default)s)',
+      type=_PositiveInteger,
+  )
+  parser.add_argument(
+      '--seed',
+      default=1403,
+      help='Random seed for the synthetic stream. '
+      '(Default: %(default)s)',
+      type=int,
+  )
+  parser.add_argument(
+      '--save_stream',
+      metavar='FILE',
+      help='Also write the synthetic stream to this file for reuse.',
+  )
+  golden = parser.add_mutually_exclusive_group()
+  golden.add_argument(
+      '-g',
+      '--golden',
+      metavar='DIRECTORY',
+      help='Compare the job files written with this golden copy.',
+  )
+  golden.add_argument(
+      '-u',
+      '--update_golden',
+      metavar='DIRECTORY',
+      help='Save the job files written as a new golden copy.',
+  )
+  parser.add_argument(
+      '-v',
+      '--version',
+      action='version',
+      version='%(prog)s ' + __version__)
+  return parser.parse_known_args(command_line)
+
+
+def _Main():
+  """Main program, runs the benchmark and reports results."""
+  (args, spool_arguments) = _ParseCommandLine(sys.argv[1:])
+  work = tempfile.mkdtemp(prefix='spool_bench.')
+
+  # Make the names of jobs without banners repeatable
+  spool.datetime = _FixedDateTime
+  os.environ.pop('HERCULES_NAME', None)
+
+  try:
+    if args.stream:
+      stream_path = args.stream
+      with open(stream_path, 'rb') as stream:
+        data = stream.read()
+    else:
+      data = _Synthetic(args.synthetic, args.seed)
+      stream_path = args.save_stream or os.path.join(work, 'stream.raw')
+      with open(stream_path, 'wb') as stream:
+        stream.write(data)
+
+    splitter = spool._LineSplitter()
+    lines = len(splitter.Split(data)) + bool(splitter.Remainder())
+
+    plain = os.path.join(work, 'plain')
+    elapsed = _Run(stream_path, plain, spool_arguments)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    totals = collections.defaultdict(float)
+    undo = _Instrument(totals)
+    tracemalloc.start()
+    try:
+      # On one thread, so the times measured add up to no more than
+      # the elapsed time
+      instrumented = _Run(stream_path,
+                          os.path.join(work, 'instrumented'),
+                          spool_arguments + ['--queue_depth', '0'])
+      (_, peak) = tracemalloc.get_traced_memory()
+    finally:
+      tracemalloc.stop()
+      for (owner, name, original) in undo:
+        setattr(owner, name, original)
+
+    print(f'Input:        {lines} lines, {len(data)} bytes')
+    print(f'Elapsed:      {elapsed:.3f} seconds')
+    print(f'Throughput:   {lines / elapsed:,.0f} lines/sec, '
+          f'{len(data) / elapsed / 1024 / 1024:,.2f} MiB/sec')
+    print(f'Instrumented: {instrumented:.3f} seconds, writing on the '
+          'reading thread, of which')
+    for key in ('banner scan', 'input', 'output'):
+      print(f'  {key:12s}{totals[key]:8.3f} seconds '
+            f'({100 * totals[key] / instrumented:.1f}%)')
+    print(f'Peak memory:  {peak / 1024:,.0f} KiB traced, '
+          f'{max_rss:,} KiB maximum resident')
+
+    index = os.path.basename(spool._INDEX_NAME)
+    if args.update_golden:
+      shutil.rmtree(args.update_golden, ignore_errors=True)
+      shutil.copytree(plain, args.update_golden,
+                      ignore=shutil.ignore_patterns(index))
+      print('Golden copy saved in', args.update_golden)
+    elif args.golden:
+      differences = _CompareTrees(args.golden, plain, index)
+      for difference in differences:
+        print('Golden:', difference)
+      if differences:
+        print(f'Golden:       {len(differences)} differences')
+        return 1
+      print('Golden:       job files match')
+  finally:
+    shutil.rmtree(work, ignore_errors=True)
+
+  return 0
+
+# Invoke the main program (above)
+if __name__ == '__main__':
+  sys.exit(_Main())
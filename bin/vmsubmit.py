@@ -6,39 +6,108 @@
 """Send a text file to a user via the VM reader or UTF protocol"""
 
 import argparse
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import ctypes
+import ctypes.util
 import enum
+import fcntl
+import functools
 import ftplib
 from ftplib import FTP
 import getpass
+import hashlib
 from http import client
 from http import HTTPStatus
 import io
+import json
 from os import path
 import os
+import select
+import signal
 import socket
+import sqlite3
+import struct
 import sys
+import termios
+import threading
 import time
 
-__version__ = '1.3.1'
+import ebcdic
+
+__version__ = '1.16.0'
 __author__ = 'ahd@kew.com (Drew Derbyshire)'
 __copyright__ = ('Version ' + __version__ + '. '
                  'Copyright 2018-2024 by Kendra Electronic Wonderworks. '
                  'All commercial rights reserved.\n'
                 )
 
-TRANSLATE_TABLE = None
-
 ASCII_DEFAULT_PORT = int(os.getenv('HERCULES_ASCII_READER', default='1442'))
 EBCDIC_DEFAULT_PORT = int(os.getenv('HERCULES_EBCDIC_READER', default='2540'))
 UFT_DEFAULT_PORT = int(os.getenv('HERCULES_SIFT_PORT', default='608')) 
 FTP_DEFAULT_PORT = socket.getservbyname('ftp')
 
+# Host sent to if no -H is given, looked up only when it is needed
+DEFAULT_HOST = 'Hercules'
+
+# Size of each read from a local file
+CHUNK_SIZE = 64 * 1024
+
+# Columns of a card image, and of the tab stops expanded in a deck
+CARD_SIZE = 80
+TAB_SIZE = 8
+
+# Size of each write to the host, and the delay after each for FIXED pacing
+SLICE_SIZE = 4096
+FIXED_DELAY = 0.20
+
+# For ADAPTIVE pacing, the most unacknowledged bytes to leave queued on the
+# socket before sending more, and the default ceiling in bytes per second.
+ADAPTIVE_LOW_WATER = 8 * SLICE_SIZE
+ADAPTIVE_MAX_RATE = 1024 * 1024
+
+# Seconds to wait for the host to connect, reply, or take more data
+RESPONSE_TIMEOUT = 60
+
+# Seconds to wait for the name of a host, only wanted for messages
+REVERSE_TIMEOUT = 1.0
+
 class Transport(enum.StrEnum):
   """Choices for our transport protocol"""
   FTP = 'FTP'
   RDR = 'RDR'
   UFT = 'UFT'
 
+class LongLines(enum.StrEnum):
+  """Choices for ASCII lines too long for one card of a deck"""
+  FOLD = 'FOLD'
+  TRUNCATE = 'TRUNCATE'
+
+class Stats(enum.StrEnum):
+  """Choices for reporting transfer measurements"""
+  JSON = 'JSON'
+  TEXT = 'TEXT'
+
+class Pacing(enum.StrEnum):
+  """Choices for how fast to send data to the host"""
+  ADAPTIVE = 'ADAPTIVE'
+  FIXED = 'FIXED'
+
+PACING = None
+FTP_POOL = None
+SUBMISSION_CACHE = None
+
+# Measurements of the file being sent, see _Measure
+METRICS = contextvars.ContextVar('METRICS', default=None)
+
+# Files sent at once to one host and port (for a reader, one device)
+DEVICE_LIMIT = 1
+
+# Seconds between scans of a --watch directory for files to send
+WATCH_INTERVAL = 2
+
 # We LIKE how we preface internal routines with underscores.
 # pylint: disable=C0103
 
@@ -49,6 +118,18 @@ def _ParseCommandLine(command_line):
     """Look up Transport enum based on upper case string param."""
     return Transport(member.upper())
 
+  def _LongLinesUpper(member):
+    """Look up LongLines enum based on upper case string param."""
+    return LongLines(member.upper())
+
+  def _StatsUpper(member):
+    """Look up Stats enum based on upper case string param."""
+    return Stats(member.upper())
+
+  def _PacingUpper(member):
+    """Look up Pacing enum based on upper case string param."""
+    return Pacing(member.upper())
+
   def _PositiveInteger(value):
     """Convert passed value to a positive integer and verify it."""
     ivalue = int(value)
@@ -71,6 +152,22 @@ def _ParseCommandLine(command_line):
         f'"{value}" is longer than eight characters')
     return ivalue
 
+  def _HostAddress(value):
+    """Look up the IP address of the named host."""
+    try:
+      return _Address(value)
+    except OSError as ex:
+      raise argparse.ArgumentTypeError(
+          f'"{value}" is not a known host: {ex}') from ex
+
+  def _CodePage(value):
+    """Look up the named EBCDIC code page."""
+    try:
+      return ebcdic.Lookup(value)
+    except KeyError as ex:
+      raise argparse.ArgumentTypeError(
+          f'"{value}" is not a known code page') from ex
+
   parser = argparse.ArgumentParser(
       description='Transmit a file to a user on VM '
       '(or connected via a VM system) either via '
@@ -80,16 +177,25 @@ def _ParseCommandLine(command_line):
       epilog=__copyright__
   )
 
+  def _TransportLimit(value):
+    """Convert TRANSPORT=COUNT to a (Transport, positive int) pair."""
+    (transport, _, count) = value.partition('=')
+    try:
+      return (_TransportUpper(transport), _PositiveInteger(count))
+    except ValueError as ex:
+      raise argparse.ArgumentTypeError(
+          f'"{value}" is not TRANSPORT=COUNT') from ex
+
   parser.add_argument(
       '-H',
       '--host',
-      default='Hercules',
+      action='append',
       help='The TCP/IP hostname of the server to connect to; '
       'files are delivered to '
       'the specified login on this host unless the UFT or remote node options '
-      'are specified. '
-      '(Default: %(default)s)',
-      type=socket.gethostbyname,
+      'are specified.  May be repeated to send every file to each host. '
+      f'(Default: {DEFAULT_HOST})',
+      type=_HostAddress,
   )
   parser.add_argument(
       '-p',
@@ -185,6 +291,34 @@ def _ParseCommandLine(command_line):
       'enabled for files of type VMARC and XMI, '
       'which are always in EBCDIC.)'
   )
+  parser.add_argument(
+      '-c',
+      '--codepage',
+      default=ebcdic.LEGACY,
+      metavar='CODEPAGE',
+      help='EBCDIC code page to translate card decks and the header '
+      'cards of EBCDIC reader files with; one of '
+      f'{", ".join(ebcdic.CODE_PAGES)}. '
+      '(Default: %(default)s)',
+      type=_CodePage,
+  )
+  parser.add_argument(
+      '-k',
+      '--deck',
+      default=False,
+      action='store_true',
+      help='Build ASCII files into decks of 80 column EBCDIC card images, '
+      'sent as EBCDIC files (so via the EBCDIC reader port). '
+      '(Default: %(default)s)'
+  )
+  parser.add_argument(
+      '--long_lines',
+      type=_LongLinesUpper,
+      default=LongLines.FOLD,
+      choices=[f'{choice}' for choice in LongLines],
+      help='What to do with lines of a deck longer than one card. '
+      '(Default: %(default)s)'
+  )
   parser.add_argument(
       '-o',
       '--os',
@@ -216,7 +350,130 @@ def _ParseCommandLine(command_line):
       '--sleep',
       metavar='SECONDS',
       default=1,
-      help='Interval in seconds to sleep between file submissions. '
+      help='Interval in seconds to sleep between files sent to the same '
+      'reader device (RDR transport); UFT and FTP files are not delayed. '
+      '(Default: %(default)s)',
+      type=_PositiveInteger,
+  )
+  parser.add_argument(
+      '--cache',
+      metavar='DATABASE',
+      default=None,
+      help='SQLite database recording the files sent; a file unchanged '
+      'since it was last sent to the same host, login, node and name '
+      'via the same transport is not sent again. '
+      '(Default: no cache, send every file)',
+  )
+  parser.add_argument(
+      '-f',
+      '--force',
+      default=False,
+      action='store_true',
+      help='Send files even if the cache says they are unchanged. '
+      '(Default: %(default)s)'
+  )
+  parser.add_argument(
+      '-B',
+      '--batch',
+      default=False,
+      action='store_true',
+      help='Send all the files to each host in one session, '
+      'rather than connecting for each file.  UFT only. '
+      '(Default: %(default)s)'
+  )
+  parser.add_argument(
+      '--timeout',
+      metavar='SECONDS',
+      default=RESPONSE_TIMEOUT,
+      help='Seconds to wait for the host to connect, reply to a command, '
+      'or accept more data. '
+      '(Default: %(default)s)',
+      type=_PositiveInteger,
+  )
+  parser.add_argument(
+      '--pipeline',
+      default=False,
+      action='store_true',
+      help='Send all the UFT header commands for a file at once, then '
+      'check the replies, rather than waiting for each reply in turn. '
+      '(Default: %(default)s)'
+  )
+  parser.add_argument(
+      '-j',
+      '--jobs',
+      metavar='COUNT',
+      default=1,
+      help='Number of files to send at once. '
+      '(Default: %(default)s)',
+      type=_PositiveInteger,
+  )
+  parser.add_argument(
+      '--device_limit',
+      metavar='COUNT',
+      default=DEVICE_LIMIT,
+      help='Most files to send at once to one host and port; '
+      'a reader device only takes one file at a time. '
+      '(Default: %(default)s)',
+      type=_PositiveInteger,
+  )
+  parser.add_argument(
+      '--transport_limit',
+      metavar='TRANSPORT=COUNT',
+      action='append',
+      default=[],
+      help='Most files to send at once via a transport. '
+      'May be repeated. '
+      '(Default: no limit other than --jobs)',
+      type=_TransportLimit,
+  )
+  parser.add_argument(
+      '--pacing',
+      type=_PacingUpper,
+      default=Pacing.FIXED,
+      choices=[f'{choice}' for choice in Pacing],
+      help='How fast to send data: FIXED sends '
+      f'{SLICE_SIZE} bytes every {FIXED_DELAY} seconds, which is safe for '
+      'any Hercules reader; ADAPTIVE sends as fast as the host '
+      'acknowledges the data, up to --max_rate. '
+      '(Default: %(default)s)'
+  )
+  parser.add_argument(
+      '--max_rate',
+      metavar='BYTES',
+      default=ADAPTIVE_MAX_RATE,
+      help='Most bytes per second to send with ADAPTIVE pacing. '
+      '(Default: %(default)s)',
+      type=_PositiveInteger,
+  )
+  parser.add_argument(
+      '--stats',
+      type=_StatsUpper,
+      default=None,
+      choices=[f'{choice}' for choice in Stats],
+      help='Report, for each file and in total, the time spent connecting, '
+      'in the prologue, reading and encoding, and sleeping to pace the '
+      'data (including pacing of the prologue), the bytes sent, and the '
+      'throughput, as TEXT or as JSON lines. '
+      '(Default: no report)'
+  )
+  parser.add_argument(
+      '-w',
+      '--watch',
+      metavar='DIRECTORY',
+      help='Run until stopped, sending each file written to or moved into '
+      'DIRECTORY, then moving it to DIRECTORY/done or, if it could not be '
+      'sent, DIRECTORY/failed.  Files whose names start with a dot are '
+      'ignored, so a file may be written under such a name and renamed '
+      'when complete.  No files may be named on the command line. '
+      '(Default: send the files named and exit)'
+  )
+  parser.add_argument(
+      '--watch_interval',
+      metavar='SECONDS',
+      default=WATCH_INTERVAL,
+      help='Interval in seconds to check the --watch directory when '
+      'inotify is not available; a file is sent once it is the same size '
+      'and age from one check to the next. '
       '(Default: %(default)s)',
       type=_PositiveInteger,
   )
@@ -234,60 +491,358 @@ def _ParseCommandLine(command_line):
       version='%(prog)s ' + __version__)
   parser.add_argument(
       'file',
-      nargs='+',
+      nargs='*',
       help='File(s) to send to VM',
       type=str,
   )
-  return parser.parse_args(command_line)
+  args = parser.parse_args(command_line)
+  if args.watch and args.file:
+    parser.error('argument -w/--watch: not allowed with files')
+  if not args.watch and not args.file:
+    parser.error('the following arguments are required: file')
+  # Each host only once, in the order given; none means DEFAULT_HOST
+  args.host = list(dict.fromkeys(args.host or []))
+  if args.batch and args.transport != Transport.UFT:
+    parser.error('argument -B/--batch: only supported for UFT')
+  return args
+
+
+@functools.cache
+def _Address(host):
+  """Look up the IP address of a host, only once for each name."""
+  return socket.gethostbyname(host)
+
+
+class _ReverseNames:
+  """Names of host addresses, looked up once each, for messages only.
+
+  Each lookup runs in its own daemon thread, so a slow or missing
+  resolver delays a message at most REVERSE_TIMEOUT seconds, once per
+  address, and never delays sending.  Until a name is found, or if there
+  is none, the address stands in for it.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.names = {}
+    self.lookups = {}
+    self.waited = set()
+
+  def Prefetch(self, address):
+    """Start looking up the name of an address, if not already."""
+    with self.lock:
+      if address in self.names or address in self.lookups:
+        return self.lookups.get(address)
+      lookup = threading.Thread(target=self._Lookup,
+                                args=(address,),
+                                daemon=True)
+      self.lookups[address] = lookup
+    lookup.start()
+    return lookup
+
+  def Name(self, address):
+    """Report the name of an address, or the address if none is known."""
+    lookup = self.Prefetch(address)
+    with self.lock:
+      wait = lookup and address not in self.waited
+      self.waited.add(address)
+    if wait:
+      lookup.join(REVERSE_TIMEOUT)
+    with self.lock:
+      return self.names.get(address, address)
+
+  def _Lookup(self, address):
+    try:
+      name = socket.gethostbyaddr(address)[0]
+    except OSError:
+      name = address
+    with self.lock:
+      self.names[address] = name
+      del self.lookups[address]
+
+
+REVERSE_NAMES = _ReverseNames()
 
 
 def _HostName(keywords, port=False):
   """Format hostname, host IP address, and port for messages."""
   if port:
-    return (f'{socket.gethostbyaddr(keywords["host"])[0]}:'
+    return (f'{REVERSE_NAMES.Name(keywords["host"])}:'
             f'{keywords["port"]} '
             f'({keywords["host"]})')
 
-  return (f'{socket.gethostbyaddr(keywords["host"])[0]}:'
+  return (f'{REVERSE_NAMES.Name(keywords["host"])}:'
           f'{keywords["port"]} '
           f'({keywords["host"]})')
 
-def _Send(network_socket, buffer, debug, translate=False):
-  """Write buffer, translating if needed and making strings bytes."""
-  if translate:
-    buffer = buffer.translate(TRANSLATE_TABLE)
+def _Measure(name, amount):
+  """Add to a measurement of the file being sent, if any."""
+  metrics = METRICS.get()
+  if metrics is not None:
+    metrics[name] += amount
+
+
+@contextlib.contextmanager
+def _Timer(name):
+  """Measure the time spent in a with block."""
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    _Measure(name, time.perf_counter() - start)
+
+
+def _Track(file_info):
+  """Measure the sending of file_info from now on."""
+  file_info['started'] = time.monotonic()
+  METRICS.set(file_info['metrics'])
+
+
+def _Finished(file_info):
+  """Note that file_info has been sent, and how long it took."""
+  file_info['metrics']['elapsed'] = time.monotonic() - file_info['started']
+  file_info['sent'] = True
+  # Closing the connection afterwards is not charged to the file
+  METRICS.set(None)
+
+
+def _Encode(buffer, codepage=None):
+  """Convert a string to bytes, translating it to EBCDIC if requested.
 
+  We don't trust Python locale to do the right thing; each character is
+  sent as its own code point, which for ASCII and Latin-1 text is done
+  (and translated) a whole buffer at a time.
+  """
+  try:
+    data = buffer.encode('latin-1')
+  except UnicodeEncodeError:
+    if codepage and codepage.name != ebcdic.LEGACY:
+      return codepage.Encode(buffer)
+
+    # Characters beyond Latin-1 are sent untranslated as the bytes of
+    # their code point, as we always have, in as few bytes as it fits.
+    if codepage:
+      buffer = buffer.translate(codepage.encode_table.decode('latin-1'))
+    return b''.join(ord(x).to_bytes(max(1, (ord(x).bit_length() + 7) // 8))
+                    for x in buffer)
+
+  if codepage:
+    return codepage.Translate(data)
+  return data
+
+
+def _Send(network_socket, buffer, debug, codepage=None):
+  """Write buffer, translating if needed and making strings bytes."""
   if isinstance(buffer, str):
-    # We don't trust Python locale to do the right thing; this brute force
-    # handles conversion in ASCII -or- if we translated to EBCDIC above.
     if debug:
-      if len(buffer) < 82 and not translate:
+      if len(buffer) < 82 and not codepage:
         print(f'Sending {len(buffer)} characters:', buffer.rstrip())
       else:
         print(f'Sending {len(buffer)} characters')
-    buffer = bytes.fromhex(''.join([f'{ord(x):02x}' for x in buffer]))
+    buffer = _Encode(buffer, codepage)
 
   else:
     if debug:
       print(f'Sending {len(buffer)} data bytes')
 
-  for offset in range(0, len(buffer), 4096):
-    network_socket.send(buffer[offset:offset + 4096])
-    if debug:
-      print(offset, flush=True)
-    time.sleep(0.20)
+  (PACING or _Pacer()).Send(network_socket, (buffer,), debug)
 
   if debug:
     print('')
 
 
-def _Expect(network_socket, prompt, expected, debug):
+def _SendStream(network_socket, chunks, debug):
+  """Write an iterable of byte chunks, such as from _ReadChunks."""
+  if debug:
+    print('Sending data bytes')
+
+  (PACING or _Pacer()).Send(network_socket, chunks, debug)
+
+  if debug:
+    print('')
+
+
+def _Unacknowledged(network_socket):
+  """Report bytes queued on a socket not yet acknowledged, or None."""
+  try:
+    result = fcntl.ioctl(network_socket.fileno(),
+                         termios.TIOCOUTQ,       # Same as SIOCOUTQ
+                         struct.pack('i', 0))
+  except (AttributeError, OSError):
+    return None
+  return struct.unpack('i', result)[0]
+
+
+def _Slices(chunks):
+  """Regroup an iterable of byte chunks as (offset, SLICE_SIZE slice)."""
+  offset = 0
+  partial = b''
+
+  for chunk in chunks:
+    # Slices are always full sized except the very last one, so only
+    # a partial slice left from the previous chunk is ever copied.
+    view = memoryview(partial + chunk if partial else chunk)
+    whole = len(view) - len(view) % SLICE_SIZE
+    for index in range(0, whole, SLICE_SIZE):
+      yield (offset, view[index:index + SLICE_SIZE])
+      offset += SLICE_SIZE
+    partial = bytes(view[whole:])
+
+  if partial:
+    yield (offset, partial)
+
+
+class _Pacer:
+  """Write data to the host no faster than it can take it.
+
+  FIXED pacing sends a slice and then sleeps, which protects the Hercules
+  card reader from overrun but caps throughput near 20 KB/s.
+
+  ADAPTIVE pacing sends a slice whenever the host has acknowledged all
+  but a little of what we've sent, so we go as fast as the reader really
+  consumes the data, up to a maximum rate.  Where the socket output queue
+  cannot be read, ADAPTIVE falls back to FIXED.
+  """
+
+  def __init__(self, pacing=Pacing.FIXED, max_rate=ADAPTIVE_MAX_RATE):
+    self.pacing = pacing
+    self.max_rate = max_rate
+
+  def Send(self, network_socket, chunks, debug):
+    """Write all of an iterable of byte chunks to the socket."""
+    adaptive = (self.pacing == Pacing.ADAPTIVE and
+                _Unacknowledged(network_socket) is not None)
+    start = time.monotonic()
+
+    for (offset, data) in _Slices(chunks):
+      self._SendSlice(network_socket, data, offset, start, adaptive, debug)
+
+  def _SendSlice(self,
+                 network_socket,
+                 data,
+                 offset,
+                 start,
+                 adaptive,
+                 debug):    # pylint: disable=R0913
+    """Write one slice of data and wait until it's time for the next."""
+    network_socket.sendall(data)
+    _Measure('bytes', len(data))
+    if debug:
+      print(offset, flush=True)
+
+    with _Timer('pacing'):
+      if not adaptive:
+        time.sleep(FIXED_DELAY)
+        return
+
+      self._Drain(network_socket)
+      ahead = ((offset + len(data)) / self.max_rate -
+               (time.monotonic() - start))
+      if ahead > 0:
+        time.sleep(ahead)
+
+  @staticmethod
+  def _Drain(network_socket):
+    """Wait for the host to acknowledge most of what we have sent."""
+    delay = 0.001
+    while (_Unacknowledged(network_socket) or 0) > ADAPTIVE_LOW_WATER:
+      time.sleep(delay)
+      delay = min(delay * 2, FIXED_DELAY / 4)
+
+
+class _ReplyReader:
+  """Read the replies of a server a line at a time.
+
+  A reply may arrive split over several recv() calls, or several replies
+  in one, so anything after the current line is kept for the next.  The
+  socket's own timeout (see _Connect) limits how long we wait.
+  """
+
+  def __init__(self, network_socket):
+    self.socket = network_socket
+    self.buffer = b''
+
+  def _Receive(self):
+    """Add more data from the server to the buffer, False at end of file."""
+    try:
+      data = self.socket.recv(512)
+    except TimeoutError as ex:
+      raise TimeoutError(f'No reply within {self.socket.gettimeout()} '
+                         'seconds') from ex
+    self.buffer += data
+    return bool(data)
+
+  def Line(self):
+    """Return the next line from the server, or '' at end of file."""
+    while (end := self.buffer.find(b'\n')) < 0:
+      if not self._Receive():
+        (line, self.buffer) = (self.buffer, b'')
+        return line.decode(encoding='utf-8', errors='replace')
+
+    line = self.buffer[:end + 1]
+    self.buffer = self.buffer[end + 1:]
+    return line.decode(encoding='utf-8', errors='replace')
+
+  def Reply(self):
+    """Return the next reply, with every line of a multi-line reply.
+
+    As in FTP, a multi-line reply starts with a code and a hyphen, and
+    ends with a line starting with the same code and a space.
+    """
+    reply = self.Line()
+    if reply[3:4] == '-':
+      code = reply[:3]
+      while line := self.Line():
+        reply += line
+        if line[:3] == code and line[3:4] != '-':
+          break
+    return reply
+
+  def Closed(self):
+    """Report, without waiting, if the server has hung up on us."""
+    while select.select([self.socket], [], [], 0)[0]:
+      if not self._Receive():
+        return True
+    return False
+
+
+def _Connect(keywords, kind):
+  """Connect to the host in keywords, or report the failure and die."""
+  try:
+    with _Timer('connect'):
+      return socket.create_connection((keywords['host'], keywords['port']),
+                                      timeout=keywords['timeout'])
+  except OSError as ex:
+    print(f'Connection to {_HostName(keywords, port=True)} {kind}failed.',
+          ex)
+    sys.exit(ex.errno or 1)
+
+
+def _Expect(replies, prompt, expected, debug):
   """Write a line to the server & look for any of the expected response(s)"""
   if prompt:
     if debug:
       print(f'Sending:  {prompt},\twant: {expected}')
-    _Send(network_socket, f'{prompt}\r\n', False)
+    _Send(replies.socket, f'{prompt}\r\n', False)
+
+  _Check(replies, prompt, expected, debug)
 
+
+def _ExpectAll(replies, commands, debug):
+  """Write many lines to the server at once, then check each response"""
+  if debug:
+    for (prompt, expected) in commands:
+      print(f'Sending:  {prompt},\twant: {expected}')
+  _Send(replies.socket,
+        ''.join(f'{prompt}\r\n' for (prompt, _) in commands),
+        False)
+
+  for (prompt, expected) in commands:
+    _Check(replies, prompt, expected, debug)
+
+
+def _Check(replies, prompt, expected, debug):
+  """Look for any of the expected response(s) to a line sent"""
   if not expected:
     return
 
@@ -295,8 +850,19 @@ def _Expect(network_socket, prompt, expected, debug):
   if not isinstance(expected, (tuple, list)):
     expected = (expected,)
 
-  actual = network_socket.recv(512).decode(encoding='utf-8')
+  actual = replies.Reply()
+
+  if _Matches(actual, expected):
+    return
+
+  # Bad response from server, quit conversation, report it and die.
+  _Send(replies.socket, 'QUIT\r\n', debug)
+  raise client.BadStatusLine(
+     f'\nSent: {prompt},\nExpected: {expected},\nReceived: {actual}')
+
 
+def _Matches(actual, expected):
+  """Report if a server response starts with any expected response."""
   for entry in expected:
     if isinstance(entry, HTTPStatus):
       entry = str(entry.value)
@@ -304,12 +870,9 @@ def _Expect(network_socket, prompt, expected, debug):
       entry = str(entry)
 
     if actual.startswith(entry):
-      return
+      return True
 
-  # Bad response from server, quit conversation, report it and die.
-  _Send(network_socket, 'QUIT\r\n', debug)
-  raise client.BadStatusLine(
-     f'\nSent: {prompt},\nExpected: {expected},\nReceived: {actual}')
+  return False
 
 
 def _CharacterSet(is_ebcdic):
@@ -321,94 +884,95 @@ def _CharacterSet(is_ebcdic):
   return "ASCII"
 
 
-def _UftPrologue(keywords,
-         file_info,
-         network_socket):
-  """Generate header records for a UFT submission"""
-  _Expect(network_socket,
-      None,
-      ('2', HTTPStatus.CONTINUE),
-      keywords['debug'])
-  _Expect(network_socket,
-      f'FILE {file_info["length"]} {getpass.getuser().upper()}',
-      (HTTPStatus.CREATED, HTTPStatus.OK),
-      keywords['debug'])
-  _Expect(network_socket,
-      f'USER {keywords["login"]}',
-      HTTPStatus.OK,
-      keywords['debug'])
+def _UftCommands(keywords, file_info):
+  """List the UFT header commands for a file with their expected replies"""
+  accepted = (HTTPStatus.CREATED, HTTPStatus.OK)
+  commands = [
+      (f'FILE {file_info["length"]} {getpass.getuser().upper()}', accepted),
+      (f'USER {keywords["login"]}', (HTTPStatus.OK,)),
+  ]
 
   if file_info['is_ebcdic']:
-    _Expect(network_socket,
-        'TYPE I', (HTTPStatus.CREATED, HTTPStatus.OK),
-        keywords['debug'])
-    _Expect(network_socket,
-        'LRECL 80', (HTTPStatus.CREATED, HTTPStatus.OK),
-        keywords['debug'])
+    commands.append(('TYPE I', accepted))
+    commands.append(('LRECL 80', accepted))
   else:
-    _Expect(network_socket,
-        'TYPE A', (HTTPStatus.CREATED, HTTPStatus.OK),
-        keywords['debug'])
+    commands.append(('TYPE A', accepted))
 
-  _Expect(network_socket,
-      f'NAME {file_info["fname"]}.{file_info["ftype"]}',
-      (HTTPStatus.CREATED, HTTPStatus.OK),
-      keywords['debug'])
+  commands.append((f'NAME {file_info["fname"]}.{file_info["ftype"]}',
+                   accepted))
 
   if keywords["remote_node"]:
-    _Expect(network_socket,
-        f'DEST {keywords["remote_node"]}',
-        (HTTPStatus.CREATED, HTTPStatus.OK),
-        keywords['debug'])
+    commands.append((f'DEST {keywords["remote_node"]}', accepted))
 
-  _Expect(network_socket,
-      f'DATE {file_info["date"]}',
-      (HTTPStatus.CREATED, HTTPStatus.OK),
-      keywords['debug'])
-  _Expect(network_socket,
-      f'DATA {file_info["length"]}',
-       (123, HTTPStatus.CREATED),
-       keywords['debug'])
+  commands.append((f'DATE {file_info["date"]}', accepted))
+  commands.append((f'DATA {file_info["length"]}',
+                   (123, HTTPStatus.CREATED)))
+  return commands
+
+
+def _UftPrologue(keywords,
+         file_info,
+         replies):
+  """Generate header records for a UFT submission"""
+  commands = _UftCommands(keywords, file_info)
+
+  if keywords['pipeline']:
+    _ExpectAll(replies, commands, keywords['debug'])
+    return
+
+  for (command, expected) in commands:
+    _Expect(replies, command, expected, keywords['debug'])
 
 
 def _UftSend(keywords,
-       file_info,
-       data_buffer):
-  """Send a file to the IBM host via a remote UFT server"""
+       *file_infos):
+  """Send files to the IBM host via a remote UFT server
 
-  if not file_info['is_ebcdic']:
-    # Internet protocol is \r\n for new lines.
-    data_buffer = data_buffer.replace('\n', '\r\n')
-    file_info['length'] = len(data_buffer)
+  RFC 1440 allows any number of files per session, each ending with EOF,
+  so a batch of files shares one connection and greeting.
+  """
 
   if keywords['debug']:
     print(f'Opening UFT host {_HostName(keywords, port=True)} '
-        f'for {_CharacterSet(file_info["is_ebcdic"])} '
-        f'file {file_info["fname"]}.{file_info["ftype"]} '
-        f'with {file_info["length"]} bytes '
-        f'for user {keywords["login"]})')
+        f'for {len(file_infos)} file(s) '
+        f'for user {keywords["login"]}')
 
-  try:
-    network_socket = socket.create_connection(
-        (keywords['host'],
-         keywords['port']))
-  except (OSError) as ex:
-    print('Connection to '
-          f'{_HostName(keywords, port=True)} failed.',
-          ex)
-    sys.exit(ex.errno)
+  # The first file is charged with opening the session
+  _Track(file_infos[0])
+  network_socket = _Connect(keywords, '')
+  replies = _ReplyReader(network_socket)
 
   try:
-    _UftPrologue(keywords,
-           file_info,
-           network_socket)
-    _Send(network_socket,
-        data_buffer,
-        keywords['debug'])
-    _Expect(network_socket,
-        'EOF', ('213', HTTPStatus.OK),
-        keywords['debug'])
-    _Expect(network_socket,
+    with _Timer('prologue'):
+      _Expect(replies,
+          None,
+          ('2', HTTPStatus.CONTINUE),
+          keywords['debug'])
+
+    for file_info in file_infos:
+      if file_info is not file_infos[0]:
+        _Track(file_info)
+      _UftLength(file_info)
+      if keywords['debug']:
+        print(f'Sending {_CharacterSet(file_info["is_ebcdic"])} '
+              f'file {file_info["fname"]}.{file_info["ftype"]} '
+              f'with {file_info["length"]} bytes')
+      with _Timer('prologue'):
+        _UftPrologue(keywords,
+               file_info,
+               replies)
+      _SendStream(network_socket,
+          _ReadChunks(file_info, crlf=True),
+          keywords['debug'])
+      _Expect(replies,
+          'EOF', ('213', HTTPStatus.OK),
+          keywords['debug'])
+      _Finished(file_info)
+      print('File '
+            f'{file_info["fname"]} {file_info["ftype"]} {file_info["fmode"]} '
+            'sent via UFT')
+
+    _Expect(replies,
         'QUIT', ('250', HTTPStatus.OK),
         keywords['debug'])
   finally:
@@ -417,15 +981,10 @@ def _UftSend(keywords,
       network_socket.close()
     except (OSError, ConnectionResetError) as ex:
       print('Error during shutdown/close of UFT socket:', ex)
-    print('File '
-          f'{file_info["fname"]} {file_info["ftype"]} {file_info["fmode"]} '
-          'sent via UFT')
 
 
-def _ReaderPrologue(keywords,
-          file_info,
-          network_socket):
-  """Generate Header records for a submission to the VM reader"""
+def _ReaderCards(keywords, file_info):
+  """List the header cards for a submission to the VM reader"""
 
   is_os = keywords['is_os']
 
@@ -459,7 +1018,7 @@ def _ReaderPrologue(keywords,
     read_card = None
   else:
     # :READ  PROFILE  EXEC     A1 AHD191 03/18/18 16:18:44
-    disk_label = socket.gethostname().upper().split('.')[0].split('-')[0]
+    disk_label = _LocalHostName().upper().split('.')[0].split('-')[0]
     read_card = (':READ  '
            f'{file_info["fname"]:8.8s} '
            f'{file_info["ftype"]:8.8s} '
@@ -468,18 +1027,35 @@ def _ReaderPrologue(keywords,
            f'{file_info["date"]:17s}'
           )
 
+  cards = []
   for card in (id_card, tag_card, read_card):
     if card:
       if file_info['is_ebcdic']:
-        card = f'{card:80}'.translate(TRANSLATE_TABLE)
+        cards.append(f'{card:80}')
       else:
-        card = card + '\n'
-      _Send(network_socket, card, keywords['debug'])
+        cards.append(card + '\n')
+  return cards
+
+
+@functools.cache
+def _LocalHostName():
+  """Report the name of this host, only asking once."""
+  return socket.gethostname()
+
+
+def _ReaderPrologue(keywords,
+          file_info,
+          network_socket):
+  """Generate Header records for a submission to the VM reader"""
+  for card in _ReaderCards(keywords, file_info):
+    _Send(network_socket,
+          card,
+          keywords['debug'],
+          codepage=file_info['is_ebcdic'] and keywords['codepage'])
 
 
 def _ReaderSend(keywords,
-        file_info,
-        data_buffer):
+        file_info):
   """Send a file to the IBM host via a networked VM virtual reader"""
 
   if keywords['debug']:
@@ -488,20 +1064,26 @@ def _ReaderSend(keywords,
         f'{file_info["fname"]} {file_info["ftype"]} {file_info["fmode"]} '
         f'for user {keywords["login"]}')
 
-  try:
-    network_socket = socket.create_connection((keywords['host'],
-                                               keywords['port']))
-  except (OSError, ConnectionRefusedError) as ex:
-    print(f'Connection to {_HostName(keywords, port=True)} reader failed.',
-          ex)
-    sys.exit(ex.errno)
+  _Track(file_info)
+  network_socket = _Connect(keywords, 'reader ')
+  replies = _ReplyReader(network_socket)
 
   try:
-    _ReaderPrologue(keywords,
-            file_info,
-            network_socket)
-
-    _Send(network_socket, data_buffer, keywords['debug'])
+    with _Timer('prologue'):
+      _ReaderPrologue(keywords,
+              file_info,
+              network_socket)
+
+    _SendStream(network_socket, _ReadChunks(file_info), keywords['debug'])
+
+    # The reader never answers, but Hercules hangs up on a connection to
+    # a reader already in use, which sending alone may not notice.
+    if replies.Closed():
+      raise ConnectionResetError(
+          f'Reader on {_HostName(keywords, port=True)} closed the '
+          'connection; is it busy?')
+    if replies.buffer and keywords['debug']:
+      print('Reader sent:', replies.buffer)
   finally:
     try:
       network_socket.shutdown(socket.SHUT_RDWR) # pylint: disable=E1101
@@ -510,16 +1092,16 @@ def _ReaderSend(keywords,
       print('Error during shutdown/close of reader socket:', ex)
       # sys.exit(ex.errno)
 
-    print('File '
-          f'{file_info["fname"]} {file_info["ftype"]} {file_info["fmode"]} '
-          'sent to '
-          f'{_HostName(keywords)} '
-          'via reader')
+  _Finished(file_info)
+  print('File '
+        f'{file_info["fname"]} {file_info["ftype"]} {file_info["fmode"]} '
+        'sent to '
+        f'{_HostName(keywords)} '
+        'via reader')
 
 
 def _FTPSend(keywords,
-            file_info,
-            data_buffer):
+            file_info):
   """Send a file to the IBM host via FTP"""
 
   if keywords['debug']:
@@ -532,47 +1114,162 @@ def _FTPSend(keywords,
     print('Password not provided for', keywords['transport'])
     sys.exit(89)
 
-  connection = FTP()
-
-  if keywords['debug']:
-    connection.set_debuglevel(min(keywords['debug'], 2))
+  _Track(file_info)
+  pool = FTP_POOL or _FTPPool()
+  connection = pool.Acquire(keywords)
 
-  try:
-    connection.connect(host=keywords['host'], port=keywords['port'])
-  except (OSError, ConnectionRefusedError) as ex:
-    print(f'Connection to {_HostName(keywords, port=True)} reader failed.',
-          ex)
-    sys.exit(ex.errno)
+  stor_command = (f'STOR '
+                  f'{file_info["fname"]}.'
+                  f'{file_info["ftype"]}.'
+                  f'{file_info["fmode"]}')
 
+  stored = False
   try:
-    if 'account' in keywords:
-      connection.login(user=keywords['login'],
-                       passwd=keywords['password'],
-                       acct=keywords['account'])
-      # Send the account provided, to act as minidisk 191 password.
-      connection.sendcmd(f'ACCT {keywords["account"]}')
+    if file_info['is_ebcdic']:
+      # EBCDIC files and decks go as is, in binary (TYPE I)
+      with _ChunkReader(_ReadChunks(file_info)) as handle:
+        connection.storbinary(stor_command, handle)
+    else:
+      # ASCII text goes a line at a time (TYPE A), for VM to translate
+      with io.BufferedReader(_ChunkReader(_ReadChunks(file_info))) as handle:
+        connection.storlines(stor_command, handle)
+    stored = True
+    _Finished(file_info)
+  finally:
+    # A session that failed in mid transfer is dropped, not reused.
+    if stored:
+      pool.Release(keywords, connection)
     else:
-      connection.login(user=keywords['login'], passwd=keywords['password'])
-  except (ftplib.error_perm,) as ex:
-    print(f'Login to {_HostName(keywords)} failed:', ex)
-    sys.exit(96)
+      connection.close()
+    if pool is not FTP_POOL:
+      pool.Close()
+
+
+class _FTPPool:
+  """Logged in FTP sessions, kept to send every file over one connection.
+
+  Sessions are keyed by host, port, login and account.  Each is logged
+  in once and the SYST reply for each key is checked only once.  A
+  session is used by one file at a time; when files are sent in
+  parallel, another session is opened for the same key as needed.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.idle = collections.defaultdict(list)
+    self.systems = {}
+
+  @staticmethod
+  def _Key(keywords):
+    return (keywords['host'],
+            keywords['port'],
+            keywords['login'],
+            keywords['account'])
+
+  def Acquire(self, keywords):
+    """Return a logged in session for keywords, opening one if need be."""
+    key = self._Key(keywords)
+
+    while True:
+      with self.lock:
+        if not self.idle[key]:
+          break
+        connection = self.idle[key].pop()
+
+      # The host may have timed out an idle session
+      try:
+        with _Timer('prologue'):
+          connection.voidcmd('NOOP')
+        return connection
+      except (OSError, EOFError, ftplib.Error):
+        connection.close()
+
+    return self._Open(keywords, key)
+
+  def Release(self, keywords, connection):
+    """Return a session, after a successful transfer, for reuse."""
+    with self.lock:
+      self.idle[self._Key(keywords)].append(connection)
+
+  def Close(self):
+    """Log off all idle sessions."""
+    with self.lock:
+      connections = [connection
+                     for sessions in self.idle.values()
+                     for connection in sessions]
+      self.idle.clear()
+
+    for connection in connections:
+      try:
+        connection.quit()
+      except (OSError, EOFError, ftplib.Error):
+        connection.close()
+
+  def _Open(self, keywords, key):
+    """Connect and log in, or report the failure and die."""
+    connection = FTP(timeout=keywords['timeout'])
+
+    if keywords['debug']:
+      connection.set_debuglevel(min(keywords['debug'], 2))
+
+    try:
+      with _Timer('connect'):
+        connection.connect(host=keywords['host'], port=keywords['port'])
+    except OSError as ex:
+      print(f'Connection to {_HostName(keywords, port=True)} reader failed.',
+            ex)
+      sys.exit(ex.errno or 1)
+
+    try:
+      with _Timer('prologue'):
+        if keywords['account']:
+          connection.login(user=keywords['login'],
+                           passwd=keywords['password'],
+                           acct=keywords['account'])
+          # Send the account provided, to act as minidisk 191 password.
+          connection.sendcmd(f'ACCT {keywords["account"]}')
+        else:
+          connection.login(user=keywords['login'],
+                           passwd=keywords['password'])
+    except (ftplib.error_perm,) as ex:
+      print(f'Login to {_HostName(keywords)} failed:', ex)
+      connection.close()
+      sys.exit(96)
+
+    with self.lock:
+      cached = key in self.systems
+    if not cached:
+      with _Timer('prologue'):
+        problem = _SystemProblem(keywords, connection.sendcmd('SYST'))
+      with self.lock:
+        self.systems[key] = problem
+
+    problem = self.systems[key]
+    if problem:
+      (status, message) = problem
+      print(message)
+      connection.close()
+      sys.exit(status)
+
+    return connection
+
 
-  text = connection.sendcmd('SYST').replace('-', ' ').splitlines()[0]
+def _SystemProblem(keywords, text):
+  """Check an FTP SYST reply, reporting (exit status, message) if unusable"""
+  text = text.replace('-', ' ').splitlines()[0]
   token = text.split(maxsplit=4)
   print(text)
 
   match token[0:4]:
     case ('215','MVS','Type:','L8'):
-      print('System',
-            _HostName(keywords),
-            'is running MVS/370 3.8 (not supported)')
-      sys.exit(97)
+      return (97,
+              f'System {_HostName(keywords)} '
+              'is running MVS/370 3.8 (not supported)')
 
     case ('215', 'VM/ESA', _, _) | ('215', 'VM', _, _) if not keywords['account']:
-      print('System',
-             _HostName(keywords),
-             'is running VM and no account was supplied.')
-      sys.exit(96)
+      return (96,
+              f'System {_HostName(keywords)} '
+              'is running VM and no account was supplied.')
 
     case ('215', 'VM/ESA', _, _) | ('215', 'VM', _, _):
       pass
@@ -581,44 +1278,163 @@ def _FTPSend(keywords,
       pass
 
     case _:
-      print('System', _HostName(keywords), 'is running unsupported', token[1])
-      sys.exit(95)
+      return (95,
+              f'System {_HostName(keywords)} '
+              f'is running unsupported {token[1]}')
 
   if keywords['debug']:
     print('System', _HostName(keywords), 'is running', token[1])
+  return None
+
+
+class _ChunkReader(io.RawIOBase):
+  """A read only file over an iterable of byte chunks, for ftplib."""
+
+  def __init__(self, chunks):
+    super().__init__()
+    self.chunks = iter(chunks)
+    self.pending = memoryview(b'')
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    while not self.pending:
+      chunk = next(self.chunks, None)
+      if chunk is None:
+        return 0
+      self.pending = memoryview(chunk)
+
+    length = min(len(buffer), len(self.pending))
+    buffer[:length] = self.pending[:length]
+    self.pending = self.pending[length:]
+    _Measure('bytes', length)
+    return length
+
+
+def _ReadChunks(file_info, crlf=False, report=True):
+  """Read a file to send as a series of byte chunks.
+
+  EBCDIC files are sent as is, and ASCII files built into decks as
+  _ReadDeck does.  Other ASCII files are read as UTF-8, have their line
+  ends normalized (to \\r\\n if crlf is set), get a final new line if
+  they lack one, and are encoded with _Encode, a chunk at a time so
+  memory use does not depend on the size of the file.
+
+  The time spent producing each chunk is measured as 'encode'.
+  """
+  chunks = _FileChunks(file_info, crlf, report)
+  while True:
+    with _Timer('encode'):
+      chunk = next(chunks, None)
+    if chunk is None:
+      return
+    yield chunk
 
-  stor_command = (f'STOR '
-                  f'{file_info["fname"]}.'
-                  f'{file_info["ftype"]}.'
-                  f'{file_info["fmode"]}')
+
+def _FileChunks(file_info, crlf, report):
+  """Read a file as byte chunks, for _ReadChunks."""
+  if file_info['deck']:
+    yield from _ReadDeck(file_info, report)
+    return
 
   if file_info['is_ebcdic']:
-    with io.BytesIO(initial_bytes=data_buffer) as handle:
-      connection.storbinary(stor_command, handle)
-  else:
-    byte_buffer = bytes.fromhex(''.join([f'{ord(x):02x}'
-                                         for x in data_buffer]))
-    with io.BytesIO(initial_bytes=byte_buffer) as handle:
-      connection.storbinary(stor_command, handle)
+    with open(file_info['path'], 'rb') as file_handle:
+      while chunk := file_handle.read(CHUNK_SIZE):
+        yield chunk
+    return
 
-    connection.storlines(stor_command, handle)
+  last = '\n'
+  with open(file_info['path'],
+            'rt',
+            encoding='utf-8',
+            errors='replace') as file_handle:
+    while text := file_handle.read(CHUNK_SIZE):
+      last = text[-1]
+      if crlf:
+        text = text.replace('\n', '\r\n')
+      yield _Encode(text)
 
+  # Insure any ASCII file ends with a new line, unless it was completely
+  # empty
+  if last != '\n':
+    yield b'\r\n' if crlf else b'\n'
+
+
+def _ReadDeck(file_info, report):
+  """Read an ASCII file as a deck of EBCDIC card images.
+
+  Whole lines are read a chunk at a time.  Their tabs are expanded and
+  each line is copied, by memoryview, into blank card images, which are
+  then translated to EBCDIC in one pass per chunk.  Lines longer than a
+  card are folded or truncated as file_info['deck'] says, and counted
+  in a report unless report is False.
+  """
+  fold = file_info['deck'] == LongLines.FOLD
+  blanks = memoryview(b' ' * CARD_SIZE)
+  long_lines = 0
+  carry = ''
+
+  with open(file_info['path'],
+            'rt',
+            encoding='utf-8',
+            errors='replace') as file_handle:
+    while True:
+      text = file_handle.read(CHUNK_SIZE)
+      if text:
+        # Hold back any partial last line for the next chunk
+        text = carry + text
+        cut = text.rfind('\n') + 1
+        (text, carry) = (text[:cut], text[cut:])
+      elif carry:
+        (text, carry) = (carry + '\n', '')
+      else:
+        break
+
+      data = text.expandtabs(TAB_SIZE).encode('latin-1', errors='replace')
+      view = memoryview(data)
+      deck = bytearray()
+      start = 0
+      while (end := data.find(b'\n', start)) >= 0:
+        if end - start > CARD_SIZE:
+          long_lines += 1
+          while fold and end - start > CARD_SIZE:
+            deck += view[start:start + CARD_SIZE]
+            start += CARD_SIZE
+        length = min(end - start, CARD_SIZE)
+        deck += view[start:start + length]
+        deck += blanks[length:]
+        start = end + 1
+
+      if deck:
+        yield file_info['codepage'].Translate(deck)
+
+  if report and long_lines:
+    print(f'{long_lines} line(s) of '
+          f'{file_info["fname"]} {file_info["ftype"]} {file_info["fmode"]} '
+          f'longer than {CARD_SIZE} columns were '
+          f'{"folded" if fold else "truncated"}')
 
-def _ProcessFile(file_path, keywords):   # pylint: disable=R0914
-  """Send a single file to VM, prefixed by USERID and READ cards."""
-  file_path = path.abspath(path.expanduser(file_path))
-  length = path.getsize(file_path)
-  date = time.strftime('%D %T', time.localtime(path.getmtime(file_path)))
 
+def _DefaultPort(keywords):
+  """Report the port to send to, if not given on the command line."""
   _DEFAULT_PORT = {
     Transport.FTP: FTP_DEFAULT_PORT,
     Transport.RDR: (ASCII_DEFAULT_PORT,
-                    EBCDIC_DEFAULT_PORT)[keywords['ebcdic']],
+                    EBCDIC_DEFAULT_PORT)[bool(keywords['ebcdic'] or
+                                              keywords['deck'])],
     Transport.UFT: UFT_DEFAULT_PORT
   }
 
-  if not keywords['port']:
-    keywords['port'] = _DEFAULT_PORT[keywords['transport']]
+  return keywords['port'] or _DEFAULT_PORT[keywords['transport']]
+
+
+def _FileInfo(file_path, keywords):
+  """Describe a local file as it will be named and sent to VM."""
+  file_path = path.abspath(path.expanduser(file_path))
+  length = path.getsize(file_path)
+  mtime = path.getmtime(file_path)
+  date = time.strftime('%D %T', time.localtime(mtime))
 
   base_name = path.basename(file_path).replace('_', '$').upper()
   base_name = base_name.strip().strip('.').split('.')
@@ -636,169 +1452,565 @@ def _ProcessFile(file_path, keywords):   # pylint: disable=R0914
     raise RuntimeError(f'Length of file {file_path} '
                f'is not a multiple of 80, it is {length}')
 
-  # Ignore possible use of "with", we have two opens for the same handle
-  # pylint: disable=R1732
-  if is_ebcdic:
-    with open(file_path, 'rb') as file_handle:
-      data_buffer = file_handle.read()
-  else:
-    with open(file_path,
-              'rt',
-              encoding='utf-8',
-              errors='replace') as file_handle:
-      data_buffer = file_handle.read()
-
-  # Insure any ASCII file ends with a new line, unless it was completely
-  # empty
-  if (not is_ebcdic and data_buffer and data_buffer[-1] != '\n'):
-    data_buffer += '\n'
+  # A deck is built from an ASCII file, and then sent as EBCDIC
+  deck = keywords['long_lines'] if keywords['deck'] and not is_ebcdic else None
 
   file_info = {
+    'path':file_path,
     'fname':fname,
     'ftype':ftype,
     'fmode':fmode,
     'date':date,
+    'mtime':mtime,
+    'size':length,
     'length':length,
-    'is_ebcdic':is_ebcdic,
+    'is_ebcdic':is_ebcdic or bool(deck),
+    'deck':deck,
+    'codepage':keywords['codepage'],
+    'metrics':collections.defaultdict(float),
   }
+  METRICS.set(file_info['metrics'])
+  return file_info
+
+
+def _UftLength(file_info):
+  """Set the length of a file as UFT sends it, just before sending it.
+
+  Internet protocol is \r\n for new lines, and decks are padded, both
+  of which change the length sent from the size on disk, so such files
+  are read once to count it.  This is left until the file is sent, so a
+  file the cache skips costs no more than a stat().
+  """
+  if file_info['deck'] or not file_info['is_ebcdic']:
+    file_info['length'] = sum(map(len, _ReadChunks(file_info,
+                                                   crlf=True,
+                                                   report=False)))
+
 
+def _ProcessFile(file_info, keywords):
+  """Send a single file to VM, prefixed by USERID and READ cards."""
   match keywords['transport']:
     case Transport.UFT:
-      _UftSend(keywords, file_info, data_buffer)
+      _UftSend(keywords, file_info)
 
     case Transport.RDR:
-      _ReaderSend(keywords, file_info, data_buffer)
+      _ReaderSend(keywords, file_info)
 
     case Transport.FTP:
-      _FTPSend(keywords, file_info, data_buffer)
+      _FTPSend(keywords, file_info)
 
     case _:
       # This shuld never happen (trappd by arg parsing)
       print('Invalid transport:', keywords['transport'])
       sys.exit(99)
 
-def _MakeTranslateTable():
-  """Build an ASCII to EBCDIC translation table."""
-  result = 256 * [chr(0xff)]
-  translate_map = {
-      'a':0x81,
-      'b':0x82,
-      'c':0x83,
-      'd':0x84,
-      'e':0x85,
-      'f':0x86,
-      'g':0x87,
-      'h':0x88,
-      'i':0x89,
-      'j':0x91,
-      'k':0x92,
-      'l':0x93,
-      'm':0x94,
-      'n':0x95,
-      'o':0x96,
-      'p':0x97,
-      'q':0x98,
-      'r':0x99,
-      's':0xA2,
-      't':0xA3,
-      'u':0xA4,
-      'v':0xA5,
-      'w':0xA6,
-      'x':0xA7,
-      'y':0xA8,
-      'z':0xA9,
-      'A':0xC1,
-      'B':0xC2,
-      'C':0xC3,
-      'D':0xC4,
-      'E':0xC5,
-      'F':0xC6,
-      'G':0xC7,
-      'H':0xC8,
-      'I':0xC9,
-      'J':0xD1,
-      'K':0xD2,
-      'L':0xD3,
-      'M':0xD4,
-      'N':0xD5,
-      'O':0xD6,
-      'P':0xD7,
-      'Q':0xD8,
-      'R':0xD9,
-      'S':0xE2,
-      'T':0xE3,
-      'U':0xE4,
-      'V':0xE5,
-      'W':0xE6,
-      'X':0xE7,
-      'Y':0xE8,
-      'Z':0xE9,
-      '0':0xF0,
-      '1':0xF1,
-      '2':0xF2,
-      '3':0xF3,
-      '4':0xF4,
-      '5':0xF5,
-      '6':0xF6,
-      '7':0xF7,
-      '8':0xF8,
-      '9':0xF9,
-      '`':0x79,
-      '-':0x60,
-      '=':0x7E,
-      '~':0xA1,
-      '!':0x5A,
-      '@':0x7C,
-      '#':0x7B,
-      '$':0x5B,
-      '%':0x6C,
-      chr(170):0x5F,          # really, logical not
-      '&':0x50,
-      '*':0x5C,
-      '(':0x4D,
-      ')':0x5D,
-      '_':0x6D,
-      '+':0x4E,
-      '[':0xAD,
-      ']':0xBD,
-      '\\':0xE0,
-      '{':0xC0,
-      '}':0xD0,
-      '|':0x4F,
-      ';':0x5E,
-      "'":0x7D,
-      ':':0x7A,
-      '"':0x7F,
-      ',':0x6B,
-      '.':0x4B,
-      '/':0x61,
-      '<':0x4C,
-      '>':0x6E,
-      '?':0x6F,
-      ' ':0x40,
-      '¬':0x5F,                # '¬' is Unicode
+  return file_info
+
+
+class _DeviceGate:
+  """Limit the files sent at once to each host and port and transport.
+
+  Each (host, port) also remembers when its last file finished, so the
+  next file to a reader device waits out the --sleep interval.  This
+  lets Hercules side networking/IO catch up, else the file may get
+  rejected by Hercules (which reports no error back to us!).  UFT and
+  FTP servers answer for each file, so they need no such gap.
+  """
+
+  def __init__(self, device_limit, transport_limits, interval):
+    self.interval = interval
+    self.lock = threading.Lock()
+    self.devices = collections.defaultdict(
+        lambda: threading.BoundedSemaphore(device_limit))
+    self.transports = {transport: threading.BoundedSemaphore(count)
+                       for (transport, count) in transport_limits}
+    self.finished = {}
+
+  def Run(self, keywords, function, *args):
+    """Run function(*args) once the device in keywords is free."""
+    device = (keywords['host'], keywords['port'])
+    transport = self.transports.get(keywords['transport'])
+
+    with self.lock:
+      semaphore = self.devices[device]
+
+    with transport or contextlib.nullcontext(), semaphore:
+      if keywords['transport'] == Transport.RDR:
+        with self.lock:
+          ready = self.finished.get(device, 0) + self.interval
+        delay = ready - time.monotonic()
+        if delay > 0:
+          time.sleep(delay)
+
+      try:
+        return function(*args)
+      finally:
+        with self.lock:
+          self.finished[device] = time.monotonic()
+
+
+class _SubmissionCache:
+  """An SQLite database of the files sent, to skip sending them again.
+
+  A file is unchanged if its size and modification time are as last
+  sent or, if only the time differs, so is its SHA-256 hash.
+  """
+
+  _SCHEMA = (
+      'CREATE TABLE IF NOT EXISTS sent ('
+      'host TEXT, login TEXT, node TEXT, name TEXT, transport TEXT, '
+      'sha256 TEXT, mtime REAL, size INTEGER, sent TEXT, '
+      'PRIMARY KEY (host, login, node, name, transport))'
+  )
+  _SELECT = ('SELECT sha256, mtime, size FROM sent WHERE host = ? AND '
+             'login = ? AND node = ? AND name = ? AND transport = ?')
+  _REPLACE = 'REPLACE INTO sent VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+
+  def __init__(self, database):
+    self.lock = threading.Lock()
+    # Other vmsubmit runs may be using the same database
+    self.connection = sqlite3.connect(database,
+                                      timeout=60.0,
+                                      check_same_thread=False)
+    with self.lock, self.connection:
+      self.connection.execute(self._SCHEMA)
+
+  @staticmethod
+  def _Key(keywords, file_info):
+    return (keywords['host'],
+            keywords['login'],
+            keywords['remote_node'] or '',
+            f'{file_info["fname"]}.{file_info["ftype"]}',
+            str(keywords['transport']))
+
+  @staticmethod
+  def _Hash(file_info):
+    """Report the SHA-256 of a file, computing it only once."""
+    if 'sha256' not in file_info:
+      digest = hashlib.sha256()
+      with open(file_info['path'], 'rb') as file_handle:
+        while chunk := file_handle.read(CHUNK_SIZE):
+          digest.update(chunk)
+      file_info['sha256'] = digest.hexdigest()
+    return file_info['sha256']
+
+  def Unchanged(self, keywords, file_info):
+    """Report if a file is the same as when last sent."""
+    with self.lock:
+      row = self.connection.execute(self._SELECT,
+                                    self._Key(keywords, file_info)).fetchone()
+    if not row:
+      return False
+
+    (sha256, mtime, size) = row
+    if size != file_info['size']:
+      return False
+    if mtime == file_info['mtime']:
+      return True
+    if sha256 != self._Hash(file_info):
+      return False
+
+    # Only touched, remember the new time so the hash is not needed again
+    self.Record(keywords, file_info)
+    return True
+
+  def Record(self, keywords, file_info):
+    """Remember a file as sent."""
+    row = (*self._Key(keywords, file_info),
+           self._Hash(file_info),
+           file_info['mtime'],
+           file_info['size'],
+           time.strftime('%Y-%m-%dT%H:%M:%S'))
+    with self.lock, self.connection:
+      self.connection.execute(self._REPLACE, row)
+
+  def Close(self):
+    """Close the database."""
+    with self.lock:
+      self.connection.close()
+
+
+def _Unchanged(keywords, file_info):
+  """Report, and say so, if the cache shows a file need not be sent."""
+  if (SUBMISSION_CACHE is None or keywords['force'] or
+      not SUBMISSION_CACHE.Unchanged(keywords, file_info)):
+    return False
+
+  print('File '
+        f'{file_info["fname"]} {file_info["ftype"]} {file_info["fmode"]} '
+        f'unchanged since sent to {keywords["host"]}, skipped')
+  file_info['skipped'] = True
+  return True
+
+
+def _Statistics(file_info, keywords):
+  """Summarize the measurements of a file sent, as a dict."""
+  metrics = file_info['metrics']
+  return {
+      'file': file_info['path'],
+      'name': f'{file_info["fname"]} {file_info["ftype"]} '
+              f'{file_info["fmode"]}',
+      'host': keywords['host'],
+      'port': keywords['port'],
+      'transport': str(keywords['transport']),
+      'connect': round(metrics['connect'], 6),
+      'prologue': round(metrics['prologue'], 6),
+      'encode': round(metrics['encode'], 6),
+      'pacing': round(metrics['pacing'], 6),
+      'bytes': int(metrics['bytes']),
+      'elapsed': round(metrics['elapsed'], 6),
+      'throughput': round(metrics['bytes'] / max(metrics['elapsed'], 0.001)),
   }
-  for key, value in translate_map.items():
-    result[ord(key)] = chr(value)
-  return ''.join(result)
+
+
+def _ReportStatistics(keywords, statistics):
+  """Print statistics from _Statistics in the format asked for."""
+  match keywords['stats']:
+    case Stats.JSON:
+      print(json.dumps(statistics), flush=True)
+
+    case Stats.TEXT:
+      print(f'Stats: {statistics.get("name", "total")} '
+            f'to {statistics.get("host", "all hosts")}: '
+            f'connect {statistics["connect"]:.3f}s, '
+            f'prologue {statistics["prologue"]:.3f}s, '
+            f'encode {statistics["encode"]:.3f}s, '
+            f'pacing {statistics["pacing"]:.3f}s, '
+            f'{statistics["bytes"]} bytes in {statistics["elapsed"]:.3f}s '
+            f'({statistics["throughput"] / 1024:,.1f} KiB/sec)',
+            flush=True)
+
+
+def _Sent(keywords, file_info):
+  """Record a file sent in the cache, if there is one, and report it."""
+  if SUBMISSION_CACHE is not None:
+    SUBMISSION_CACHE.Record(keywords, file_info)
+  if keywords['stats']:
+    _ReportStatistics(keywords, _Statistics(file_info, keywords))
+
+
+def _Submit(gate, file_path, keywords):
+  """Send one file to one host, reporting [(path, file_info, status)].
+
+  file_info is None if the file was not sent, and status is what
+  vmsubmit would exit with for it.
+  """
+  try:
+    file_info = _FileInfo(file_path, keywords)
+    if not _Unchanged(keywords, file_info):
+      gate.Run(keywords, _ProcessFile, file_info, keywords)
+      _Sent(keywords, file_info)
+    return [(file_path, file_info, 0)]
+  except SystemExit as ex:
+    return [(file_path, None, ex.code)]
+  except (OSError,
+          RuntimeError,
+          ValueError,
+          client.HTTPException,
+          ftplib.Error,
+          sqlite3.Error) as ex:
+    print(f'Sending {file_path} to {keywords["host"]} failed:', ex)
+    return [(file_path, None, getattr(ex, 'errno', None) or 1)]
+
+
+def _SubmitBatch(gate, file_paths, keywords):
+  """Send files to one host in one UFT session, reporting as _Submit."""
+  results = []
+  file_infos = []
+  for file_path in file_paths:
+    try:
+      file_info = _FileInfo(file_path, keywords)
+      if _Unchanged(keywords, file_info):
+        results.append((file_path, file_info, 0))
+      else:
+        file_infos.append((file_path, file_info))
+    except (OSError, RuntimeError, ValueError, sqlite3.Error) as ex:
+      print(f'Sending {file_path} to {keywords["host"]} failed:', ex)
+      results.append((file_path, None, getattr(ex, 'errno', None) or 1))
+
+  status = 0
+  try:
+    if file_infos:
+      gate.Run(keywords,
+               _UftSend,
+               keywords,
+               *(file_info for (_, file_info) in file_infos))
+  except SystemExit as ex:
+    status = ex.code
+  except (OSError,
+          RuntimeError,
+          ValueError,
+          client.HTTPException) as ex:
+    print(f'UFT session with {keywords["host"]} failed:', ex)
+    status = getattr(ex, 'errno', None) or 1
+
+  for (file_path, file_info) in file_infos:
+    if file_info.get('sent'):
+      _Sent(keywords, file_info)
+      results.append((file_path, file_info, 0))
+    else:
+      results.append((file_path, None, status or 1))
+  return results
+
+
+def _SubmitAll(gate, keywords):
+  """Send every file to every host, reporting as _Submit for each."""
+  submissions = []
+  for host in keywords['host']:
+    # Names are only for messages, so find them while we send
+    REVERSE_NAMES.Prefetch(host)
+    submission = dict(keywords, host=host)
+    submission['port'] = _DefaultPort(submission)
+    submissions.append(submission)
+
+  with concurrent.futures.ThreadPoolExecutor(keywords['jobs']) as pool:
+    if keywords['batch']:
+      futures = [pool.submit(_SubmitBatch, gate, keywords['file'], submission)
+                 for submission in submissions]
+    else:
+      futures = [pool.submit(_Submit, gate, current, submission)
+                 for current in keywords['file']
+                 for submission in submissions]
+    return [result
+            for future in futures
+            for result in future.result()]
+
+
+class _Inotify:
+  """Linux inotify, via ctypes, for files closed or moved into a directory."""
+
+  IN_CLOSE_WRITE = 0x00000008
+  IN_MOVED_TO = 0x00000080
+  IN_Q_OVERFLOW = 0x00004000
+
+  # struct inotify_event, less the name which follows it
+  EVENT = struct.Struct('iIII')
+
+  def __init__(self, directory):
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self.fd < 0:
+      error = ctypes.get_errno()
+      raise OSError(error, os.strerror(error))
+
+    if libc.inotify_add_watch(self.fd,
+                              os.fsencode(directory),
+                              self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+      error = ctypes.get_errno()
+      os.close(self.fd)
+      raise OSError(error, os.strerror(error), directory)
+
+  def Read(self, timeout):
+    """Wait for events, reporting (file names, True if any were lost)."""
+    (ready, _, _) = select.select([self.fd], [], [], timeout)
+    names = set()
+    overflow = False
+    if not ready:
+      return (names, overflow)
+
+    data = os.read(self.fd, CHUNK_SIZE)
+    offset = 0
+    while offset < len(data):
+      (_, mask, _, length) = self.EVENT.unpack_from(data, offset)
+      offset += self.EVENT.size
+      name = data[offset:offset + length].rstrip(b'\0')
+      offset += length
+      overflow = overflow or bool(mask & self.IN_Q_OVERFLOW)
+      if name:
+        names.add(os.fsdecode(name))
+    return (names, overflow)
+
+  def Close(self):
+    """Stop watching."""
+    os.close(self.fd)
+
+
+class _DropBox:
+  """Report the files completed in a --watch directory.
+
+  With inotify, a file is complete when closed after writing or moved
+  in.  Otherwise, and for files already there when we start or missed
+  by inotify, a file is complete once its size and modification time
+  are the same from one scan of the directory to the next.  A file
+  found by scanning is not reported again until it changes, in case it
+  could not be moved away.
+  """
+
+  def __init__(self, directory, interval):
+    self.directory = directory
+    self.interval = interval
+    self.scanned = {}
+    self.reported = {}
+    try:
+      self.inotify = _Inotify(directory)
+    except (AttributeError, OSError) as ex:
+      print(f'inotify not available ({ex}), checking {directory} '
+            f'every {interval} seconds')
+      self.inotify = None
+    self.unsettled = set(self._Scan())
+
+  def _Scan(self):
+    """Report the (size, mtime) of each file that may be sent."""
+    with os.scandir(self.directory) as entries:
+      return {entry.name: (entry.stat().st_size, entry.stat().st_mtime)
+              for entry in entries
+              if not entry.name.startswith('.') and entry.is_file()}
+
+  def Ready(self):
+    """Wait a while for files to be completed, reporting their paths."""
+    if self.inotify:
+      (ready, overflow) = self.inotify.Read(self.interval)
+    else:
+      time.sleep(self.interval)
+      (ready, overflow) = (set(), True)
+
+    current = self._Scan()
+    if overflow:
+      self.unsettled.update(current)
+    self.unsettled.intersection_update(current)
+
+    ready.update(name for name in self.unsettled
+                 if self.scanned.get(name) == current[name] and
+                 self.reported.get(name) != current[name])
+    self.unsettled.difference_update(ready)
+    self.scanned = {name: current[name] for name in self.unsettled}
+    self.reported = {name: scanned
+                     for (name, scanned) in self.reported.items()
+                     if name in current}
+    self.reported.update((name, current[name])
+                         for name in ready
+                         if name in current)
+    return [path.join(self.directory, name)
+            for name in sorted(ready)
+            if name in current]
+
+  def Close(self):
+    """Stop watching."""
+    if self.inotify:
+      self.inotify.Close()
+
+
+class _Stopper:
+  """Note SIGINT or SIGTERM, so files being sent are finished first."""
+
+  def __init__(self):
+    self.stopped = False
+    signal.signal(signal.SIGINT, self._Stop)
+    signal.signal(signal.SIGTERM, self._Stop)
+
+  # pylint: disable=W0613
+  def _Stop(self, number, stack_frame):
+    """Process signal"""
+    print(f'Stopping on signal {signal.Signals(number).name}', flush=True)
+    self.stopped = True
+
+
+def _Archive(file_path, subdirectory):
+  """Move a file into a subdirectory beside it, without replacing any."""
+  target = path.join(path.dirname(file_path),
+                     subdirectory,
+                     path.basename(file_path))
+  (base, count) = (target, 0)
+  while path.exists(target):
+    count += 1
+    target = f'{base}.{count}'
+
+  try:
+    os.replace(file_path, target)
+  except OSError as ex:
+    print(f'Moving {file_path} to {subdirectory} failed:', ex)
+
+
+def _Watch(gate, keywords):
+  """Send the files completed in the --watch directory, until stopped.
+
+  One process, with its cached host names, code pages, FTP sessions and
+  --sleep interval for each host and port, sends everything.
+  """
+  directory = path.abspath(path.expanduser(keywords['watch']))
+  for subdirectory in ('done', 'failed'):
+    os.makedirs(path.join(directory, subdirectory), exist_ok=True)
+
+  stopper = _Stopper()
+  drop_box = _DropBox(directory, keywords['watch_interval'])
+  print(f'Watching {directory} for files to send', flush=True)
+
+  try:
+    while not stopper.stopped:
+      file_paths = drop_box.Ready()
+      if not file_paths:
+        continue
+
+      results = _SubmitAll(gate, dict(keywords, file=file_paths))
+      failed = {file_path for (file_path, _, status) in results if status}
+      for file_path in file_paths:
+        _Archive(file_path, 'failed' if file_path in failed else 'done')
+      sys.stdout.flush()
+  finally:
+    drop_box.Close()
+
+  return 0
 
 
 def _Main():
   """Main program, does arg processing and then sends each named file."""
   args = _ParseCommandLine(sys.argv[1:])
-  global TRANSLATE_TABLE          # pylint: disable=W0603
-  TRANSLATE_TABLE = _MakeTranslateTable()
+  if not args.host:
+    try:
+      args.host = [_Address(DEFAULT_HOST)]
+    except OSError as ex:
+      print(f'Default host {DEFAULT_HOST} is not known: {ex}')
+      return 2
+  global PACING, FTP_POOL, SUBMISSION_CACHE   # pylint: disable=W0603
+  PACING = _Pacer(args.pacing, args.max_rate)
+  FTP_POOL = _FTPPool()
+  if args.cache:
+    SUBMISSION_CACHE = _SubmissionCache(args.cache)
   keywords = vars(args)
-  first = True
-
-  for current in args.file:
-    if not first:
-      # Allow Hercules side networking/IO to catch up, else the file may
-      # get rejected by Hercules (which reports no error back to us!).
-      time.sleep(keywords['sleep'])
-      first = False
+  gate = _DeviceGate(args.device_limit,
+                     args.transport_limit,
+                     keywords['sleep'])
+  start = time.monotonic()
 
-    _ProcessFile(current, keywords)
+  try:
+    if args.watch:
+      return _Watch(gate, keywords)
+    results = _SubmitAll(gate, keywords)
+  finally:
+    FTP_POOL.Close()
+    if SUBMISSION_CACHE is not None:
+      SUBMISSION_CACHE.Close()
+
+  elapsed = time.monotonic() - start
+  sent = [file_info for (_, file_info, _) in results
+          if file_info and not file_info.get('skipped')]
+  skipped = [file_info for (_, file_info, _) in results
+             if file_info and file_info.get('skipped')]
+  failures = [status for (_, _, status) in results if status]
+
+  if keywords['stats'] and len(sent) > 1:
+    statistics = {
+        'total': True,
+        'files': len(sent),
+    }
+    for name in ('connect', 'prologue', 'encode', 'pacing'):
+      statistics[name] = round(sum(file_info['metrics'][name]
+                                   for file_info in sent), 6)
+    statistics['bytes'] = int(sum(file_info['metrics']['bytes']
+                                  for file_info in sent))
+    statistics['elapsed'] = round(elapsed, 6)
+    statistics['throughput'] = round(statistics['bytes'] /
+                                     max(elapsed, 0.001))
+    _ReportStatistics(keywords, statistics)
+
+  if len(results) > 1:
+    total = sum(file_info['length'] for file_info in sent)
+    print(f'Sent {len(sent)} of {len(results)} files, {total} bytes '
+          f'in {elapsed:.1f} seconds '
+          f'({total / max(elapsed, 0.001) / 1024:,.1f} KiB/sec)' +
+          (f', {len(skipped)} unchanged' if skipped else ''))
+
+  return failures[0] if failures else 0
 
 # Invoke the main program (above)
 if __name__ == '__main__':
@@ -0,0 +1,440 @@
+# -*- coding: UTF-8 -*-
+# vim: ts=2 sw=2 expandtab
+
+"""asyncio transports for sending files to VM, for embedding vmsubmit.
+
+The RDR, UFT and FTP transports of vmsubmit.py, rewritten over asyncio
+streams so one event loop can submit many files to many Hercules
+instances at once.  Nothing here exits the process; each file sent
+yields a Result instead.  For example:
+
+    keywords = vmsubmit_async.Keywords('-l', 'AHD', '-T', 'UFT')
+    results = asyncio.run(vmsubmit_async.SubmitFiles(
+        ['profile.exec', 'hello.exec'],
+        keywords,
+        hosts=['hercules1', 'hercules2']))
+    failed = [result for result in results if not result.ok]
+
+Local files are still read with blocking calls, a chunk at a time; only
+the network side waits on the event loop.
+"""
+
+import asyncio
+import collections
+import dataclasses
+import re
+import time
+
+import vmsubmit
+from vmsubmit import Transport
+
+__author__ = 'ahd@kew.com (Drew Derbyshire)'
+__version__ = '1.1.0'
+
+# Host and port of an FTP passive mode (PASV) reply
+_PASSIVE_REGEX = re.compile(r'(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)')
+
+# We LIKE how we preface internal routines with underscores.
+# pylint: disable=C0103,W0212
+
+
+class SubmitError(Exception):
+  """A file could not be sent; status is what vmsubmit.py would exit with."""
+
+  def __init__(self, message, status=1):
+    super().__init__(message)
+    self.status = status
+
+
+@dataclasses.dataclass
+class Result:
+  """What happened to one file sent to one host.
+
+  metrics holds the seconds spent in connect, prologue, encode and
+  pacing, and the bytes sent, as measured for vmsubmit.py --stats.
+  """
+  path: str
+  host: str
+  port: int
+  transport: Transport
+  length: int = 0
+  elapsed: float = 0.0
+  status: int = 0
+  error: str | None = None
+  metrics: dict = dataclasses.field(default_factory=dict)
+
+  @property
+  def ok(self):
+    """Report if the file was sent."""
+    return not self.status
+
+
+def Keywords(*arguments):
+  """Build the options vmsubmit.py would use for the given arguments.
+
+  The arguments are those of the vmsubmit.py command line, less any file
+  names; bad arguments raise SystemExit, as for any argparse parser.
+  Without -H, keywords['host'] is empty and SubmitFiles sends to the
+  hosts it is given, or else to vmsubmit.DEFAULT_HOST.
+  """
+  keywords = vars(vmsubmit._ParseCommandLine([*arguments, '--', '-']))
+  del keywords['file']
+  return keywords
+
+
+async def _Connect(keywords):
+  """Open a stream connection to the host and port in keywords."""
+  try:
+    with vmsubmit._Timer('connect'):
+      return await asyncio.wait_for(
+          asyncio.open_connection(keywords['host'], keywords['port']),
+          keywords['timeout'])
+  except (OSError, asyncio.TimeoutError) as ex:
+    raise SubmitError(f'Connection to {keywords["host"]}:{keywords["port"]} '
+                      f'failed: {ex}',
+                      getattr(ex, 'errno', None) or 1) from ex
+
+
+async def _Close(writer):
+  """Close a stream connection, ignoring a host that already has."""
+  writer.close()
+  try:
+    await writer.wait_closed()
+  except OSError:
+    pass
+
+
+async def _SendChunks(writer, chunks, keywords):
+  """Write byte chunks as vmsubmit._Pacer does, without blocking."""
+  sock = writer.get_extra_info('socket')
+  adaptive = (keywords['pacing'] == vmsubmit.Pacing.ADAPTIVE and
+              vmsubmit._Unacknowledged(sock) is not None)
+  start = time.monotonic()
+
+  for (offset, data) in vmsubmit._Slices(chunks):
+    writer.write(data)
+    await writer.drain()
+    vmsubmit._Measure('bytes', len(data))
+    if keywords['debug']:
+      print(offset, flush=True)
+
+    with vmsubmit._Timer('pacing'):
+      await _Pace(sock, offset + len(data), start, adaptive, keywords)
+
+
+async def _Pace(sock, sent, start, adaptive, keywords):
+  """Wait until it is time to write the next slice."""
+  if not adaptive:
+    await asyncio.sleep(vmsubmit.FIXED_DELAY)
+    return
+
+  delay = 0.001
+  while ((vmsubmit._Unacknowledged(sock) or 0) >
+         vmsubmit.ADAPTIVE_LOW_WATER):
+    await asyncio.sleep(delay)
+    delay = min(delay * 2, vmsubmit.FIXED_DELAY / 4)
+
+  ahead = sent / keywords['max_rate'] - (time.monotonic() - start)
+  if ahead > 0:
+    await asyncio.sleep(ahead)
+
+
+async def _Expect(reader, writer, prompt, expected, keywords):
+  """Write a line to the server & look for any of the expected response(s)"""
+  if prompt:
+    if keywords['debug']:
+      print(f'Sending:  {prompt},\twant: {expected}')
+    writer.write(vmsubmit._Encode(f'{prompt}\r\n'))
+    await writer.drain()
+
+  await _Check(reader, prompt, expected, keywords)
+
+
+async def _Check(reader, prompt, expected, keywords):
+  """Look for any of the expected response(s) to a line sent"""
+  try:
+    actual = await _Reply(reader, keywords)
+  except asyncio.TimeoutError as ex:
+    raise SubmitError(f'Sent: {prompt}, no response') from ex
+
+  if not vmsubmit._Matches(actual, expected):
+    raise SubmitError(
+        f'Sent: {prompt}, Expected: {expected}, Received: {actual}')
+
+
+async def _Reply(reader, keywords):
+  """Read a reply, all lines of it if multi-line, as one string.
+
+  As in FTP, a multi-line reply starts with a code and a hyphen, and
+  ends with a line starting with the same code and a space.
+  """
+  lines = [await _Line(reader, keywords)]
+  if lines[0][3:4] == '-':
+    while not (lines[-1][:3] == lines[0][:3] and lines[-1][3:4] != '-'):
+      lines.append(await _Line(reader, keywords))
+  return '\n'.join(lines)
+
+
+async def _Line(reader, keywords):
+  """Read one line of a reply."""
+  line = await asyncio.wait_for(reader.readline(), keywords['timeout'])
+  if not line:
+    raise SubmitError('Host closed the connection')
+  return line.decode(encoding='utf-8', errors='replace').rstrip()
+
+
+async def ReaderSend(keywords, file_info):
+  """Send a file to the IBM host via a networked VM virtual reader"""
+  (_, writer) = await _Connect(keywords)
+
+  try:
+    codepage = file_info['is_ebcdic'] and keywords['codepage']
+    cards = [vmsubmit._Encode(card, codepage)
+             for card in vmsubmit._ReaderCards(keywords, file_info)]
+    with vmsubmit._Timer('prologue'):
+      await _SendChunks(writer, cards, keywords)
+    await _SendChunks(writer, vmsubmit._ReadChunks(file_info), keywords)
+  finally:
+    await _Close(writer)
+
+
+async def UftSend(keywords, file_info):
+  """Send a file to the IBM host via a remote UFT server"""
+  (reader, writer) = await _Connect(keywords)
+
+  try:
+    vmsubmit._UftLength(file_info)
+    with vmsubmit._Timer('prologue'):
+      await _UftPrologue(reader, writer, keywords, file_info)
+    await _SendChunks(writer,
+                      vmsubmit._ReadChunks(file_info, crlf=True),
+                      keywords)
+    await _Expect(reader, writer, 'EOF', ('213', 200), keywords)
+    await _Expect(reader, writer, 'QUIT', ('250', 200), keywords)
+  finally:
+    await _Close(writer)
+
+
+async def _UftPrologue(reader, writer, keywords, file_info):
+  """Wait for the UFT greeting, then describe the file to the host."""
+  await _Expect(reader, writer, None, ('2', 100), keywords)
+  commands = vmsubmit._UftCommands(keywords, file_info)
+  if keywords['pipeline']:
+    # Send the whole prologue, then check the replies in order
+    writer.write(vmsubmit._Encode(
+        ''.join(f'{command}\r\n' for (command, _) in commands)))
+    for (command, expected) in commands:
+      await _Check(reader, command, expected, keywords)
+  else:
+    for (command, expected) in commands:
+      await _Expect(reader, writer, command, expected, keywords)
+
+
+class _FTPClient:
+  """Just enough of an FTP client to log in and store files."""
+
+  def __init__(self, keywords, reader, writer):
+    self.keywords = keywords
+    self.reader = reader
+    self.writer = writer
+
+  async def Reply(self):
+    """Read a reply, all lines of it if multi-line, as one string."""
+    reply = await _Reply(self.reader, self.keywords)
+    if self.keywords['debug']:
+      print('*resp*', repr(reply))
+    return reply
+
+  async def Command(self, command, expected='2', status=1):
+    """Send a command, raising SubmitError if the reply is unexpected."""
+    if self.keywords['debug']:
+      print('*cmd*', repr(command.split()[0]))
+    self.writer.write(f'{command}\r\n'.encode('latin-1'))
+    await self.writer.drain()
+    reply = await self.Reply()
+    if not reply.startswith(expected):
+      raise SubmitError(f'{command.split()[0]} failed: {reply}', status)
+    return reply
+
+  async def Login(self):
+    """Log in as ftplib.FTP.login() does, then check the system type."""
+    await self.Reply()
+    keywords = self.keywords
+    reply = await self.Command(f'USER {keywords["login"]}', ('2', '3'), 96)
+    if reply.startswith('3'):
+      reply = await self.Command(f'PASS {keywords["password"]}',
+                                 ('2', '3'),
+                                 96)
+    if reply.startswith('3'):
+      if not keywords['account']:
+        raise SubmitError(f'Login to {keywords["host"]} needs an account, '
+                          'and none was supplied',
+                          96)
+      await self.Command(f'ACCT {keywords["account"]}', '2', 96)
+    elif keywords['account']:
+      # Send the account provided, to act as minidisk 191 password.
+      await self.Command(f'ACCT {keywords["account"]}', '2', 96)
+
+    problem = vmsubmit._SystemProblem(keywords, await self.Command('SYST'))
+    if problem:
+      (status, message) = problem
+      raise SubmitError(message, status)
+
+  async def Store(self, command, chunks, binary=True):
+    """Store chunks of data via a passive connection.
+
+    Unless binary, the data is ASCII text with \r\n line ends, sent in
+    ASCII mode (TYPE A) for the host to translate.
+    """
+    await self.Command('TYPE I' if binary else 'TYPE A')
+    reply = await self.Command('PASV')
+    match = _PASSIVE_REGEX.search(reply)
+    if not match:
+      raise SubmitError(f'Bad PASV reply: {reply}')
+    numbers = [int(number) for number in match.groups()]
+
+    # Like ftplib, trust only the port, not the address, of the reply
+    (_, data_writer) = await _Connect(
+        dict(self.keywords, port=numbers[4] * 256 + numbers[5]))
+    try:
+      await self.Command(command, '1')
+      for chunk in chunks:
+        data_writer.write(chunk)
+        await data_writer.drain()
+        vmsubmit._Measure('bytes', len(chunk))
+    finally:
+      await _Close(data_writer)
+
+    # As ftplib's voidresp(), the host may yet fail the transfer
+    reply = await self.Reply()
+    if not reply.startswith('2'):
+      raise SubmitError(f'{command.split()[0]} failed: {reply}')
+
+  async def Quit(self):
+    """Say goodbye, ignoring what the host says back."""
+    try:
+      await self.Command('QUIT')
+    except (SubmitError, OSError, asyncio.TimeoutError):
+      pass
+
+
+async def FTPSend(keywords, file_info):
+  """Send a file to the IBM host via FTP"""
+  if not keywords.get('password'):
+    raise SubmitError(f'Password not provided for {keywords["transport"]}',
+                      89)
+
+  (reader, writer) = await _Connect(keywords)
+  client = _FTPClient(keywords, reader, writer)
+
+  try:
+    with vmsubmit._Timer('prologue'):
+      await client.Login()
+    binary = file_info['is_ebcdic']
+    await client.Store(f'STOR '
+                       f'{file_info["fname"]}.'
+                       f'{file_info["ftype"]}.'
+                       f'{file_info["fmode"]}',
+                       vmsubmit._ReadChunks(file_info, crlf=not binary),
+                       binary)
+    await client.Quit()
+  finally:
+    await _Close(writer)
+
+
+_SENDERS = {
+    Transport.FTP: FTPSend,
+    Transport.RDR: ReaderSend,
+    Transport.UFT: UftSend,
+}
+
+
+async def SubmitFile(file_path, keywords):
+  """Send one file to the host in keywords, reporting a Result."""
+  keywords = dict(keywords, port=vmsubmit._DefaultPort(keywords))
+  result = Result(file_path,
+                  keywords['host'],
+                  keywords['port'],
+                  keywords['transport'])
+  start = time.monotonic()
+  file_info = None
+
+  try:
+    file_info = vmsubmit._FileInfo(file_path, keywords)
+    await _SENDERS[keywords['transport']](keywords, file_info)
+  except SubmitError as ex:
+    (result.status, result.error) = (ex.status, str(ex))
+  except Exception as ex:                 # pylint: disable=W0718
+    # Whatever went wrong, it is this file's Result, not everyone's
+    (result.status, result.error) = (getattr(ex, 'errno', None) or 1,
+                                     str(ex) or type(ex).__name__)
+
+  result.elapsed = time.monotonic() - start
+  if file_info is not None:
+    result.length = file_info['length']
+    result.metrics = dict(file_info['metrics'], elapsed=result.elapsed)
+  return result
+
+
+class _DeviceGate:
+  """The asyncio twin of vmsubmit._DeviceGate."""
+
+  def __init__(self, device_limit, transport_limits, interval):
+    self.interval = interval
+    self.devices = collections.defaultdict(
+        lambda: asyncio.Semaphore(device_limit))
+    self.transports = {transport: asyncio.Semaphore(count)
+                       for (transport, count) in transport_limits}
+    self.finished = {}
+
+  async def Submit(self, file_path, keywords):
+    """Send a file once its host and port and transport are free."""
+    device = (keywords['host'], vmsubmit._DefaultPort(keywords))
+    transport = self.transports.get(keywords['transport'])
+
+    if transport:
+      async with transport:
+        return await self._Submit(device, file_path, keywords)
+    return await self._Submit(device, file_path, keywords)
+
+  async def _Submit(self, device, file_path, keywords):
+    async with self.devices[device]:
+      if keywords['transport'] == Transport.RDR:
+        delay = (self.finished.get(device, 0) + self.interval -
+                 time.monotonic())
+        if delay > 0:
+          await asyncio.sleep(delay)
+
+      try:
+        return await SubmitFile(file_path, keywords)
+      finally:
+        self.finished[device] = time.monotonic()
+
+
+async def SubmitFiles(files,
+                      keywords,
+                      hosts=None,
+                      device_limit=vmsubmit.DEVICE_LIMIT,
+                      transport_limits=()):
+  """Send every file to every host, reporting a Result for each.
+
+  As with vmsubmit.py --jobs, at most device_limit files are sent at
+  once to each host and port, waiting keywords['sleep'] seconds between
+  files to a reader device, and transport_limits is a list of (Transport, count) pairs.
+  A host that cannot be looked up raises SubmitError.
+  """
+  gate = _DeviceGate(device_limit, transport_limits, keywords['sleep'])
+  loop = asyncio.get_running_loop()
+  names = hosts or keywords['host'] or [vmsubmit.DEFAULT_HOST]
+  hosts = []
+  for name in dict.fromkeys(names):
+    try:
+      hosts.append(await loop.run_in_executor(None, vmsubmit._Address, name))
+    except OSError as ex:
+      raise SubmitError(f'Host {name} is not known: {ex}') from ex
+  for host in hosts:
+    vmsubmit.REVERSE_NAMES.Prefetch(host)
+  return await asyncio.gather(*[
+      gate.Submit(file_path, dict(keywords, host=host))
+      for file_path in files
+      for host in hosts])